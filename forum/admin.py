@@ -1,9 +1,9 @@
 from django.contrib import admin
+from django.utils.html import format_html_join
 
 # Register your models here.
-from .models import Thread, Post, Report, Course, Resource,Category,Tag
+from .models import Thread, Post, Report, Course, Resource,Category,Tag,OutboxMessage,RequestCapture
 
-admin.site.register(Post)
 admin.site.register(Report)
 admin.site.register(Course)
 admin.site.register(Resource)
@@ -22,4 +22,55 @@ class ThreadAdmin(admin.ModelAdmin):
         "creator",
         "is_locked",
     )
-    filter_horizontal = ("courses", "resources","tags")
\ No newline at end of file
+    filter_horizontal = ("courses", "resources","tags")
+
+@admin.register(Post)
+class PostAdmin(admin.ModelAdmin):
+    # Deleting and restoring go through Post.soft_delete()/restore(), which
+    # keep Thread.reply_count in step; saving the form leaves is_deleted.
+    readonly_fields = ("is_deleted",)
+    actions = ("soft_delete_posts", "restore_posts")
+
+    @admin.action(description="Soft delete selected posts", permissions=["delete"])
+    def soft_delete_posts(self, request, queryset):
+        for post in queryset:
+            post.soft_delete()
+
+    @admin.action(description="Restore selected posts", permissions=["change"])
+    def restore_posts(self, request, queryset):
+        for post in queryset:
+            post.restore()
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ("subject", "recipient", "status", "attempts", "created_at", "sent_at")
+    list_filter = ("status",)
+    search_fields = ("recipient", "subject")
+
+@admin.register(RequestCapture)
+class RequestCaptureAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "kind", "view_name", "method", "path", "status_code", "duration_ms", "query_count", "sql_ms")
+    list_filter = ("kind", "view_name")
+    search_fields = ("path", "view_name")
+    readonly_fields = ("formatted_queries", "formatted_duplicates")
+    exclude = ("queries", "duplicate_queries")
+
+    @admin.display(description="Queries")
+    def formatted_queries(self, obj):
+        return format_html_join(
+            "", "<p>{} x{} {} ms<br><code>{}</code></p>",
+            ((q["fingerprint"], q["count"], q["ms"], q["sql"]) for q in obj.queries),
+        )
+
+    @admin.display(description="Duplicate queries")
+    def formatted_duplicates(self, obj):
+        return format_html_join(
+            "", "<p>{} x{}<br><code>{}</code></p>",
+            ((q["fingerprint"], q["count"], q["sql"]) for q in obj.duplicate_queries),
+        )
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -1,8 +1,25 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
+
+
+def ensure_full_text_search(sender, using, **kwargs):
+    from django.db import connections
+    from .search.fts import ensure_sqlite_fts
+
+    connection = connections[using]
+    if connection.vendor == "sqlite":
+        ensure_sqlite_fts(connection, create=False)
 
 
 class ForumConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'forum'
     def ready(self):
-        from . import signals
\ No newline at end of file
+        from . import signals
+        from .checks import check_shared_cache
+        from .instrumentation import install_query_timer
+        checks.register(check_shared_cache, checks.Tags.caches)
+        post_migrate.connect(ensure_full_text_search, sender=self)
+        connection_created.connect(install_query_timer)
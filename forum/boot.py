@@ -0,0 +1,128 @@
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def template_names():
+    """
+    Names of the project's own templates: everything under templates/ and
+    forum/templates/.
+    """
+    from django.apps import apps
+    from django.conf import settings
+
+    roots = [str(path) for path in settings.TEMPLATES[0]["DIRS"]]
+    roots.append(os.path.join(apps.get_app_config("forum").path, "templates"))
+
+    names = set()
+    for root in roots:
+        for directory, _, files in os.walk(root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                names.add(os.path.relpath(path, root).replace(os.sep, "/"))
+    return sorted(names)
+
+
+def precompile_templates():
+    """
+    Loads every project template through the cached loader, so workers
+    forked afterwards never parse one on a request.
+    """
+    from django.template.loader import get_template
+
+    names = template_names()
+    for name in names:
+        get_template(name)
+    return len(names)
+
+
+def warm_markdown():
+    from .rendering import render_markdown
+
+    render_markdown("**warm** `up`\n\n| a |\n|---|\n| b |\n\n```\ncode\n```")
+
+
+def warm_search():
+    """
+    Imports the search backend (and with it rapidfuzz and numpy) and loads
+    the tag matcher.
+    """
+    from django.db import DatabaseError
+
+    from .search import get_backend
+    from .search.tags import tag_matcher
+
+    try:
+        get_backend()
+        tag_matcher.match("warm up")
+    except DatabaseError:
+        logger.warning("Skipping search warm-up: database not ready", exc_info=True)
+
+
+WARM_UP_STEPS = [
+    ("templates", precompile_templates),
+    ("markdown", warm_markdown),
+    ("search and tags", warm_search),
+]
+
+
+def warm_up():
+    """
+    Runs the warm-up steps and returns [(step, seconds)]. Closes database
+    connections afterwards, so none is inherited by forked workers.
+    """
+    from django.db import connections
+
+    timings = []
+    try:
+        for name, step in WARM_UP_STEPS:
+            started = time.perf_counter()
+            step()
+            timings.append((name, time.perf_counter() - started))
+    finally:
+        connections.close_all()
+    return timings
+
+
+def measure_boot():
+    """
+    Boots the app the way a worker does and returns [(phase, seconds)].
+    Meant to run in a fresh interpreter (see the boot_profile command).
+    """
+    timings = []
+
+    def phase(name, func):
+        started = time.perf_counter()
+        func()
+        timings.append((name, time.perf_counter() - started))
+
+    def load_settings():
+        from django.conf import settings
+
+        settings.INSTALLED_APPS
+
+    def setup():
+        import django
+
+        django.setup(set_prefix=False)
+
+    def handler():
+        from django.core.handlers.wsgi import WSGIHandler
+
+        WSGIHandler()
+
+    def urlconf():
+        from django.urls import get_resolver
+
+        get_resolver().url_patterns
+
+    phase("settings", load_settings)
+    phase("apps, models and signals", setup)
+    phase("middleware", handler)
+    phase("URLconf and views", urlconf)
+    timings.extend(
+        (f"warm-up: {name}", seconds) for name, seconds in warm_up()
+    )
+    return timings
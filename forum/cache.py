@@ -0,0 +1,130 @@
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Version of the set of threads and their searchable/listed fields, bumped
+# when threads or tags change.
+THREAD_CORPUS = "thread-corpus"
+
+# Version of thread titles and contents (the in-process search index),
+# bumped when threads are saved or deleted.
+THREAD_TEXT = "thread-text"
+
+# Version of the set of tag names, bumped when tags are saved or deleted.
+TAG_NAMES = "tag-names"
+
+# Version of the username -> id mapping, bumped when users are created,
+# renamed or deleted.
+USER_DIRECTORY = "user-directory"
+
+# Cache backends whose entries live in one process: a version bumped by one
+# worker is never seen by the others.
+PROCESS_LOCAL_BACKENDS = {"django.core.cache.backends.locmem.LocMemCache"}
+
+# Shared backends whose incr() and add() are a read followed by a write:
+# two workers bumping a version at once can both store the same value (one
+# bump is lost), and single_flight's lock entry is not exclusive.
+NON_ATOMIC_BACKENDS = {
+    "django.core.cache.backends.filebased.FileBasedCache",
+    "django.core.cache.backends.db.DatabaseCache",
+}
+
+_process_locks = [threading.Lock() for _ in range(64)]
+
+
+def cache_is_shared():
+    """
+    Whether all worker processes see the same default cache, which the
+    versioned entries (thread pages, search results, tags, usernames) need
+    to be invalidated in every worker.
+    """
+    return settings.CACHES["default"]["BACKEND"] not in PROCESS_LOCAL_BACKENDS
+
+
+def cache_is_atomic():
+    """
+    Whether version bumps on the default cache are atomic across workers.
+    """
+    return settings.CACHES["default"]["BACKEND"] not in NON_ATOMIC_BACKENDS
+
+
+def _version_key(name):
+    return f"forum:version:{name}"
+
+
+def get_version(name):
+    """
+    Returns the current version of a named dataset. Versions start from the
+    current time in milliseconds, so a version lost from the cache never
+    comes back with a value that older entries were stored under.
+    """
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    """
+    Moves a named dataset to a new version, orphaning entries keyed on the
+    previous one.
+    """
+    key = _version_key(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = int(time.time() * 1000)
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def get_thread_version(thread_id):
+    return get_version(f"thread:{thread_id}")
+
+
+def bump_thread_version(thread_id):
+    """
+    Invalidates cached renderings of one thread's page.
+    """
+    return bump_version(f"thread:{thread_id}")
+
+
+def single_flight(key, compute, timeout, lock_timeout=30, poll_interval=0.05):
+    """
+    Returns the cached value for key, computing and storing it on a miss.
+
+    Concurrent misses for the same key run compute() once: threads of this
+    process wait on a local lock, and other processes wait on a lock entry
+    in the shared cache until the value appears (or the lock expires).
+    compute() must not return None.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    with _process_locks[zlib.crc32(key.encode()) % len(_process_locks)]:
+        value = cache.get(key)
+        if value is not None:
+            return value
+
+        lock_key = f"{key}:lock"
+        deadline = time.monotonic() + lock_timeout
+        while not cache.add(lock_key, 1, lock_timeout):
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(poll_interval)
+            value = cache.get(key)
+            if value is not None:
+                return value
+
+        try:
+            value = compute()
+            cache.set(key, value, timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
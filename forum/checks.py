@@ -0,0 +1,43 @@
+import os
+
+from django.core.checks import Warning
+
+from .cache import cache_is_atomic, cache_is_shared
+
+
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Cached thread pages, search results, tags and usernames are invalidated
+    by bumping versions in the default cache; on a per-process cache the
+    other workers keep serving what the writing worker invalidated.
+    """
+    try:
+        workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    except ValueError:
+        return []
+    if workers > 1 and not cache_is_shared():
+        return [
+            Warning(
+                f"WEB_CONCURRENCY is {workers} but the default cache is per-process.",
+                hint=(
+                    "Workers would serve thread pages and search results other "
+                    "workers have invalidated. Set CACHE_BACKEND and "
+                    "CACHE_LOCATION to a shared cache (see .env.example)."
+                ),
+                id="forum.W001",
+            )
+        ]
+    if workers > 1 and not cache_is_atomic():
+        return [
+            Warning(
+                f"WEB_CONCURRENCY is {workers} but the default cache's incr and add are not atomic.",
+                hint=(
+                    "Concurrent version bumps can be lost, so a page rendered "
+                    "before a reply may stay cached under the new version for "
+                    "FORUM_THREAD_CACHE_TIMEOUT. Use redis or memcached "
+                    "(see .env.example)."
+                ),
+                id="forum.W002",
+            )
+        ]
+    return []
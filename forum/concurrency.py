@@ -0,0 +1,69 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=settings.FORUM_CPU_POOL_SIZE,
+                    thread_name_prefix="forum-cpu",
+                )
+    return _pool
+
+
+def release_connections():
+    """
+    Pool threads are few and long-lived, so each keeps its database
+    connections for its next call (whatever CONN_MAX_AGE says, which with
+    its default of 0 would mean connecting for every call). Only a
+    connection a call left broken or inside a transaction is closed.
+    """
+    for conn in connections.all(initialized_only=True):
+        if conn.connection is None:
+            continue
+        if conn.get_autocommit() != conn.settings_dict["AUTOCOMMIT"]:
+            conn.close()
+        elif conn.errors_occurred:
+            if conn.is_usable():
+                conn.errors_occurred = False
+            else:
+                conn.close()
+
+
+def _call(func, args, kwargs):
+    try:
+        return func(*args, **kwargs)
+    finally:
+        release_connections()
+
+
+async def run_in_pool(func, *args, **kwargs):
+    """
+    Runs a CPU-heavy sync function (fuzzy scoring, markdown and template
+    rendering) on the bounded forum thread pool, so the event loop keeps
+    serving other requests and at most FORUM_CPU_POOL_SIZE such calls run
+    at once. With FORUM_CPU_POOL_SIZE = 0 the call runs on the request's
+    own sync thread instead (used by forum_bench to count its queries).
+    """
+    if not settings.FORUM_CPU_POOL_SIZE:
+        return await sync_to_async(func)(*args, **kwargs)
+    loop = asyncio.get_running_loop()
+    # Run in a copy of the caller's context, so the call's queries and
+    # renders are timed as part of the request.
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        get_pool(), partial(context.run, _call, func, args, kwargs)
+    )
@@ -0,0 +1,346 @@
+"""
+Per-request timings (SQL, template rendering, markdown, notification
+enqueueing), sent to staff as a Server-Timing header and aggregated into
+per-view histograms for the Prometheus endpoint.
+
+Each worker process keeps its own histograms and periodically writes a
+snapshot to FORUM_METRICS_DIR; the endpoint merges every worker's
+snapshot, so a scrape of any worker sees the whole server.
+"""
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates, Template
+from django.utils.decorators import sync_and_async_middleware
+
+# Upper bounds of the histogram buckets, in seconds.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+PHASES = ("sql", "template", "markdown", "notify")
+
+METRICS = {
+    "forum_requests_total": ("counter", "Requests by view and status code."),
+    "forum_request_queries_total": ("counter", "SQL queries run by requests, by view."),
+    "forum_request_duration_seconds": ("histogram", "Request duration by view."),
+    "forum_request_phase_seconds": (
+        "histogram",
+        "Time per request spent in SQL, template rendering, markdown and notification enqueueing, by view.",
+    ),
+}
+
+_current = ContextVar("forum_request_timings", default=None)
+
+
+# Statements kept per request when they are being captured.
+MAX_STATEMENTS = 1000
+
+
+class RequestTimings:
+    def __init__(self):
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.queries = 0
+        self.active = set()
+        # Threads that did work for the request (event loop, sync and
+        # pool threads), for stack sampling.
+        self.threads = {threading.get_ident()}
+        # [(sql, seconds)] once capturing is switched on (forum.profiling).
+        self.statements = None
+
+
+def current_timings():
+    return _current.get()
+
+
+@contextmanager
+def untimed():
+    """
+    Work in the block is not counted towards the current request.
+    """
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed(phase):
+    """
+    Adds the time spent in the block (or decorated function) to the
+    current request's phase. Nested blocks of the same phase count once.
+    """
+    timings = _current.get()
+    if timings is None or phase in timings.active:
+        yield
+        return
+    timings.active.add(phase)
+    timings.threads.add(threading.get_ident())
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.seconds[phase] += time.perf_counter() - started
+        timings.active.discard(phase)
+
+
+def record_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    timings.threads.add(threading.get_ident())
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        timings.queries += 1
+        timings.seconds["sql"] += elapsed
+        if timings.statements is not None and len(timings.statements) < MAX_STATEMENTS:
+            timings.statements.append((sql, elapsed))
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """
+    connection_created receiver: every connection, in any thread, reports
+    its queries to the request it runs for.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        with timed("template"):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, timing each top-level render (includes
+    and extends are part of their parent's render).
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+class Histograms:
+    """
+    Counters and histograms of this process, sharded by thread: a thread
+    only ever writes its own shard, so recording takes no lock. Readers
+    sum the shards.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def inc(self, name, labels, amount=1):
+        shard = self._shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        shard = self._shard()
+        key = (name, labels)
+        series = shard.get(key)
+        if series is None:
+            # Per-bucket counts (the last one is +Inf), then sum and count.
+            series = shard[key] = [0] * (len(BUCKETS) + 1) + [0.0, 0]
+        series[bisect.bisect_left(BUCKETS, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def snapshot(self):
+        """
+        Returns [[name, labels, value]] with labels as [[key, value]] and
+        value a number (counters) or a list (histograms).
+        """
+        with self._shards_lock:
+            shards = list(self._shards)
+        totals = {}
+        for shard in shards:
+            for key, value in list(shard.items()):
+                add_series(totals, key, value)
+        return [[name, [list(pair) for pair in labels], value] for (name, labels), value in totals.items()]
+
+
+histograms = Histograms()
+
+
+def add_series(totals, key, value):
+    if isinstance(value, list):
+        current = totals.get(key)
+        totals[key] = value[:] if current is None else [a + b for a, b in zip(current, value)]
+    else:
+        totals[key] = totals.get(key, 0) + value
+
+
+def record_request(view, status, duration, timings):
+    labels = (("view", view),)
+    histograms.inc("forum_requests_total", labels + (("status", str(status)),))
+    histograms.inc("forum_request_queries_total", labels, timings.queries)
+    histograms.observe("forum_request_duration_seconds", labels, duration)
+    for phase, seconds in timings.seconds.items():
+        histograms.observe("forum_request_phase_seconds", labels + (("phase", phase),), seconds)
+
+
+def server_timing(duration, timings):
+    entries = [
+        f'sql;dur={timings.seconds["sql"] * 1000:.1f};desc="{timings.queries} queries"',
+    ]
+    entries.extend(
+        f"{phase};dur={timings.seconds[phase] * 1000:.1f}" for phase in PHASES[1:]
+    )
+    entries.append(f"total;dur={duration * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def view_name(request):
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match else "unmatched"
+
+
+_last_flush = time.monotonic()
+
+
+def flush_due():
+    return time.monotonic() - _last_flush >= settings.FORUM_METRICS_FLUSH_INTERVAL
+
+
+def flush():
+    """
+    Writes this process's snapshot to FORUM_METRICS_DIR/<pid>.json.
+    """
+    global _last_flush
+    _last_flush = time.monotonic()
+    os.makedirs(settings.FORUM_METRICS_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=settings.FORUM_METRICS_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(histograms.snapshot(), f)
+    os.replace(path, os.path.join(settings.FORUM_METRICS_DIR, f"{os.getpid()}.json"))
+
+
+def clear_snapshots():
+    """
+    Removes snapshots left by earlier runs; called when gunicorn starts.
+    """
+    if os.path.isdir(settings.FORUM_METRICS_DIR):
+        for filename in os.listdir(settings.FORUM_METRICS_DIR):
+            os.unlink(os.path.join(settings.FORUM_METRICS_DIR, filename))
+
+
+def merged_snapshot():
+    """
+    Sums the snapshots of all workers (including ones that have exited,
+    so counters never go backwards).
+    """
+    totals = {}
+    directory = settings.FORUM_METRICS_DIR
+    for filename in os.listdir(directory) if os.path.isdir(directory) else ():
+        if not filename.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                series = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, labels, value in series:
+            add_series(totals, (name, tuple(tuple(pair) for pair in labels)), value)
+    return totals
+
+
+def format_labels(labels):
+    def escape(value):
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels) + "}"
+
+
+def prometheus_text(totals):
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        series = sorted((labels, value) for (series_name, labels), value in totals.items() if series_name == name)
+        if not series:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in series:
+            if kind == "counter":
+                lines.append(f"{name}{format_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), value[:-2]):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {value[-2]}")
+            lines.append(f"{name}_count{format_labels(labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def finish(request, response, timings, started, is_staff):
+    duration = time.perf_counter() - started
+    record_request(view_name(request), response.status_code, duration, timings)
+    if is_staff:
+        response["Server-Timing"] = server_timing(duration, timings)
+
+
+@sync_and_async_middleware
+def instrumentation_middleware(get_response):
+    """
+    Times each request and its SQL, template, markdown and notification
+    phases. Goes first in MIDDLEWARE, so the other middleware is included.
+    """
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            timings = RequestTimings()
+            token = _current.set(timings)
+            started = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                _current.reset(token)
+            user = await request.auser() if hasattr(request, "auser") else None
+            finish(request, response, timings, started, user is not None and user.is_staff)
+            if flush_due():
+                await sync_to_async(flush)()
+            return response
+
+    else:
+
+        def middleware(request):
+            timings = RequestTimings()
+            token = _current.set(timings)
+            started = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                _current.reset(token)
+            user = getattr(request, "user", None)
+            finish(request, response, timings, started, user is not None and user.is_staff)
+            if flush_due():
+                flush()
+            return response
+
+    return middleware
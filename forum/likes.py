@@ -0,0 +1,130 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .cache import bump_thread_version
+
+
+def toggle_like(obj, user):
+    """
+    Likes obj (a Thread or Post) for user, or removes the like if present,
+    and returns whether obj is now liked.
+
+    The join row is inserted or deleted directly and obj.like_count is
+    adjusted with an F() update in the same transaction, so the cost does
+    not depend on how many likes obj already has.
+    """
+    model = type(obj)
+    field = model._meta.get_field("likes")
+    through = field.remote_field.through
+    link = {
+        f"{field.m2m_field_name()}_id": obj.pk,
+        f"{field.m2m_reverse_field_name()}_id": user.pk,
+    }
+
+    thread_id = getattr(obj, "thread_id", obj.pk)
+
+    with transaction.atomic():
+        transaction.on_commit(lambda: bump_thread_version(thread_id))
+        deleted, _ = through.objects.filter(**link).delete()
+        if deleted:
+            model.objects.filter(pk=obj.pk).update(like_count=F("like_count") - deleted)
+            return False
+
+        try:
+            with transaction.atomic():
+                through.objects.create(**link)
+        except IntegrityError:
+            # A concurrent request recorded (and counted) the same like.
+            return True
+        model.objects.filter(pk=obj.pk).update(like_count=F("like_count") + 1)
+        return True
+
+
+def _liked_queryset(model, ids, user):
+    ids = list(ids)
+    if not ids or not user.is_authenticated:
+        return None
+    field = model._meta.get_field("likes")
+    owner = f"{field.m2m_field_name()}_id"
+    return (
+        field.remote_field.through.objects
+        .filter(**{
+            f"{owner}__in": ids,
+            f"{field.m2m_reverse_field_name()}_id": user.pk,
+        })
+        .values_list(owner, flat=True)
+    )
+
+
+def liked_ids(model, ids, user):
+    """
+    Returns the subset of ids (of Thread or Post rows) that user likes,
+    with one query on the join table.
+    """
+    queryset = _liked_queryset(model, ids, user)
+    return set() if queryset is None else set(queryset)
+
+
+async def aliked_ids(model, ids, user):
+    queryset = _liked_queryset(model, ids, user)
+    return set() if queryset is None else {pk async for pk in queryset}
+
+
+def mark_liked(objects, user):
+    """
+    Sets liked_by_me on already loaded Thread or Post objects.
+    """
+    objects = list(objects)
+    if objects:
+        liked = liked_ids(type(objects[0]), [obj.pk for obj in objects], user)
+        for obj in objects:
+            obj.liked_by_me = obj.pk in liked
+    return objects
+
+
+async def amark_liked(objects, user):
+    objects = list(objects)
+    if objects:
+        liked = await aliked_ids(type(objects[0]), [obj.pk for obj in objects], user)
+        for obj in objects:
+            obj.liked_by_me = obj.pk in liked
+    return objects
+
+
+def _count(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset
+            .filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(total=Count("*"))
+            .values("total")
+        ),
+        Value(0),
+    )
+
+
+def rebuild_counters(thread_model, post_model):
+    """
+    Recomputes Thread.like_count, Thread.reply_count and Post.like_count
+    from the join tables and replies. Takes the model classes so that data
+    migrations can pass their historical models.
+    """
+    thread_likes = thread_model._meta.get_field("likes")
+    post_likes = post_model._meta.get_field("likes")
+
+    thread_model.objects.update(
+        like_count=_count(
+            thread_likes.remote_field.through.objects.all(),
+            thread_likes.m2m_field_name(),
+        ),
+        reply_count=_count(post_model.objects.filter(is_deleted=False), "thread"),
+    )
+    post_model.objects.update(
+        like_count=_count(
+            post_likes.remote_field.through.objects.all(),
+            post_likes.m2m_field_name(),
+        ),
+    )
@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection, connections
+from django.utils.module_loading import import_string
+
+from .concurrency import run_in_pool
+from .pages import render_reply
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKENDS = {
+    "postgresql": "forum.live.PostgresFanout",
+}
+FALLBACK_BACKEND = "forum.live.LocalFanout"
+
+
+class Broker:
+    """
+    In-process pub/sub of "thread has new replies" wake-ups. Subscribers
+    are asyncio events on the loop of the stream waiting on them; wake()
+    may be called from any thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, thread_id, loop, event):
+        with self._lock:
+            self._subscribers[thread_id].add((loop, event))
+
+    def unsubscribe(self, thread_id, loop, event):
+        with self._lock:
+            subscribers = self._subscribers.get(thread_id)
+            if subscribers:
+                subscribers.discard((loop, event))
+                if not subscribers:
+                    del self._subscribers[thread_id]
+
+    def wake(self, thread_id):
+        with self._lock:
+            subscribers = list(self._subscribers.get(thread_id, ()))
+        for loop, event in subscribers:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The stream's loop has closed; it unsubscribes on exit.
+                pass
+
+
+broker = Broker()
+
+
+class LocalFanout:
+    """
+    Wakes streams in this process only. Fine for a single process and in
+    tests.
+    """
+
+    def start(self):
+        pass
+
+    def publish(self, thread_id):
+        broker.wake(thread_id)
+
+
+class PostgresFanout:
+    """
+    Fans out through Postgres LISTEN/NOTIFY, so streams in every worker
+    and host are woken. Each process runs one listener thread on its own
+    connection, started with the first stream.
+    """
+
+    channel = "forum_replies"
+    poll_timeout = 5
+
+    def __init__(self):
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        if not self._started:
+            with self._lock:
+                if not self._started:
+                    threading.Thread(
+                        target=self._listen, name="forum-live-listener", daemon=True
+                    ).start()
+                    self._started = True
+
+    def publish(self, thread_id):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [self.channel, str(thread_id)])
+
+    def _listen(self):
+        while True:
+            db = connections.create_connection("default")
+            try:
+                db.ensure_connection()
+                db.set_autocommit(True)
+                raw = db.connection
+                with raw.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel}")
+                while True:
+                    if select.select([raw], [], [], self.poll_timeout) == ([], [], []):
+                        continue
+                    raw.poll()
+                    while raw.notifies:
+                        notify = raw.notifies.pop(0)
+                        broker.wake(int(notify.payload))
+            except Exception:
+                logger.exception("Live reply listener failed, reconnecting")
+                time.sleep(self.poll_timeout)
+            finally:
+                db.close()
+
+
+@lru_cache(maxsize=None)
+def get_fanout():
+    """
+    Returns the configured fan-out backend, or the default for the current
+    database when FORUM_LIVE_BACKEND is empty.
+    """
+    path = settings.FORUM_LIVE_BACKEND or DEFAULT_BACKENDS.get(
+        connection.vendor, FALLBACK_BACKEND
+    )
+    return import_string(path)()
+
+
+def publish_reply(thread_id):
+    get_fanout().publish(thread_id)
+
+
+def format_event(event_id, event, data):
+    lines = [f"id: {event_id}", f"event: {event}"]
+    lines.extend(f"data: {line}" for line in data.splitlines() or [""])
+    return "\n".join(lines) + "\n\n"
+
+
+def render_replies(posts):
+    return [render_reply(post) for post in posts]
+
+
+async def reply_events(thread_id, last_id):
+    """
+    Yields Server-Sent Events for replies to the thread with ids above
+    last_id, then for every new reply as it is published, with a comment
+    line every FORUM_LIVE_KEEPALIVE seconds to keep proxies from closing
+    the connection.
+
+    The stream ends after FORUM_LIVE_MAX_AGE seconds and the browser
+    reconnects from the last event it got, so no stream holds its request
+    thread and database connection indefinitely. While waiting, the
+    connection is released like at the end of a request.
+    """
+    from .models import Post
+
+    get_fanout().start()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.FORUM_LIVE_MAX_AGE
+    wakeup = asyncio.Event()
+    broker.subscribe(thread_id, loop, wakeup)
+    try:
+        yield f"retry: {settings.FORUM_LIVE_RETRY_MS}\n\n"
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            wakeup.clear()
+            posts = [
+                post async for post in
+                Post.objects
+                .filter(thread_id=thread_id, id__gt=last_id, is_deleted=False)
+                .select_related("author")
+                .only(
+                    "id",
+                    "thread_id",
+                    "content",
+                    "content_html",
+                    "created_at",
+                    "is_deleted",
+                    "is_hidden",
+                    "like_count",
+                    "author__id",
+                    "author__email",
+                )
+                .order_by("id")[:50]
+            ]
+            if posts:
+                for reply in await run_in_pool(render_replies, posts):
+                    yield format_event(reply["id"], "reply", reply["html"].strip())
+                last_id = posts[-1].id
+                continue
+            await sync_to_async(close_old_connections)()
+            try:
+                await asyncio.wait_for(
+                    wakeup.wait(), min(settings.FORUM_LIVE_KEEPALIVE, remaining)
+                )
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+    finally:
+        broker.unsubscribe(thread_id, loop, wakeup)
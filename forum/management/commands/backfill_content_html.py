@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from forum.models import Post, Thread
+from forum.rendering import render_markdown
+
+
+class Command(BaseCommand):
+    help = "Render stored markdown HTML for threads and posts that lack it"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Re-render every row, e.g. after changing markdown extensions",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        for model in (Thread, Post):
+            queryset = model.objects.only("id", "content")
+            if not options["all"]:
+                queryset = queryset.filter(content_html="")
+
+            batch = []
+            rendered = 0
+            for obj in queryset.iterator(chunk_size=options["batch_size"]):
+                obj.content_html = render_markdown(obj.content)
+                batch.append(obj)
+                if len(batch) >= options["batch_size"]:
+                    model.objects.bulk_update(batch, ["content_html"])
+                    rendered += len(batch)
+                    batch = []
+            if batch:
+                model.objects.bulk_update(batch, ["content_html"])
+                rendered += len(batch)
+
+            self.stdout.write(
+                f"{model._meta.verbose_name_plural}: rendered {rendered}"
+            )
+
+        self.stdout.write(self.style.SUCCESS("Content HTML backfilled"))
@@ -0,0 +1,76 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+BOOT_SCRIPT = (
+    "import json, forum.boot; "
+    "print(json.dumps(forum.boot.measure_boot()))"
+)
+
+
+class Command(BaseCommand):
+    help = "Report where app start-up time goes: imports per package and boot phases"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=15,
+            help="Number of packages to list by import time",
+        )
+
+    def handle(self, *args, **options):
+        # A fresh interpreter, so nothing is already imported or warm.
+        env = {
+            **os.environ,
+            "DJANGO_SETTINGS_MODULE": os.environ.get(
+                "DJANGO_SETTINGS_MODULE", settings.SETTINGS_MODULE
+            ),
+        }
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", BOOT_SCRIPT],
+            capture_output=True,
+            text=True,
+            env=env,
+            cwd=settings.BASE_DIR,
+        )
+        if result.returncode:
+            raise CommandError(result.stderr.strip().splitlines()[-1])
+
+        phases = json.loads(result.stdout.strip().splitlines()[-1])
+        packages = self.import_times(result.stderr)
+
+        self.stdout.write("Import time by top-level package (cumulative):")
+        for package, seconds in packages[:options["limit"]]:
+            self.stdout.write(f"  {seconds * 1000:9.1f} ms  {package}")
+        total_imports = sum(seconds for _, seconds in packages)
+        self.stdout.write(f"  {total_imports * 1000:9.1f} ms  total")
+
+        self.stdout.write("")
+        self.stdout.write("Boot phases:")
+        for name, seconds in phases:
+            self.stdout.write(f"  {seconds * 1000:9.1f} ms  {name}")
+        total_boot = sum(seconds for _, seconds in phases)
+        self.stdout.write(f"  {total_boot * 1000:9.1f} ms  total")
+
+    def import_times(self, output):
+        """
+        Sums `-X importtime` cumulative times of outermost imports by their
+        top-level package, slowest first.
+        """
+        totals = defaultdict(float)
+        for line in output.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            # Nested imports are indented; their time is already included
+            # in their importer's cumulative time.
+            if name.startswith("  "):
+                continue
+            totals[name.strip().split(".")[0]] += int(cumulative) / 1e6
+        return sorted(totals.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,209 @@
+import json
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from forum.models import Tag
+from forum.seeding import seed
+
+# SQLite "EXPLAIN QUERY PLAN" details of a full table scan, e.g.
+# "SCAN forum_post" (index scans read "SCAN forum_post USING INDEX ...").
+SQLITE_FULL_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+
+def thread_list(client, data):
+    return client.get(reverse("thread_list"))
+
+
+def thread_list_deep(client, data):
+    return client.get(reverse("thread_list"), {"page": max(1, len(data.thread_ids) // 13 // 2)})
+
+
+def thread_detail(client, data):
+    # The first threads get the most replies.
+    return client.get(reverse("thread_detail", args=[min(data.thread_ids)]))
+
+
+def threads_by_tag(client, data):
+    tag = Tag.objects.get(id=data.tag_ids[0])
+    return client.get(reverse("threads_by_tag", args=[tag.slug]))
+
+
+def filter_by_tags(client, data):
+    return client.get(reverse("filter_by_tags"), {"tags": data.tag_ids[:2]})
+
+
+def search_threads(client, data):
+    return client.get(reverse("search_threads"), {"q": "exam notes"})
+
+
+def moderate(client, data):
+    return client.get(reverse("moderate"))
+
+
+def my_mentions(client, data):
+    return client.get(reverse("my_mentions"))
+
+
+VIEWS = {
+    "thread_list": thread_list,
+    "thread_list_deep": thread_list_deep,
+    "thread_detail": thread_detail,
+    "threads_by_tag": threads_by_tag,
+    "filter_by_tags": filter_by_tags,
+    "search_threads": search_threads,
+    "moderate": moderate,
+    "my_mentions": my_mentions,
+}
+
+
+class SelectCollector:
+    """
+    Execute wrapper keeping the SELECT statements a view runs, with their
+    parameters, for EXPLAIN.
+    """
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith("SELECT"):
+            self.statements.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def sqlite_scans(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        details = [row[-1] for row in cursor.fetchall()]
+    scans = []
+    for detail in details:
+        match = SQLITE_FULL_SCAN.match(detail)
+        if match:
+            scans.append((match.group(1), detail))
+    return scans
+
+
+def postgres_scans(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    scans = []
+    nodes = [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if node["Node Type"] == "Seq Scan":
+            scans.append((node["Relation Name"], f"Seq Scan on {node['Relation Name']}"))
+        nodes.extend(node.get("Plans", ()))
+    return scans
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a large throwaway database, run the listed views and EXPLAIN "
+        "their queries, failing if any falls back to a full scan of a large table"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--threads", type=int, default=5000)
+        parser.add_argument("--replies", type=int, default=30000)
+        parser.add_argument("--likes", type=int, default=20000)
+        parser.add_argument("--tags", type=int, default=50)
+        parser.add_argument("--reports", type=int, default=1000)
+        parser.add_argument(
+            "--min-rows",
+            type=int,
+            default=1000,
+            help="Ignore full scans of tables with fewer rows than this",
+        )
+        parser.add_argument(
+            "--views",
+            nargs="+",
+            choices=list(VIEWS),
+            default=list(VIEWS),
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ("sqlite", "postgresql"):
+            raise CommandError(f"Query plans are not checked on {connection.vendor}")
+
+        setup_test_environment()
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # A private, empty cache so cached pages are built (and their
+            # queries run) on the first request; CPU pool work runs inline
+            # so its queries are collected too.
+            with override_settings(
+                CACHES={"default": {
+                    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                    "LOCATION": "forum-query-plans",
+                }},
+                FORUM_CPU_POOL_SIZE=0,
+            ):
+                problems = self.check_plans(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if problems:
+            raise CommandError(f"{problems} full scan(s) of large tables")
+        self.stdout.write(self.style.SUCCESS("No full scans of large tables"))
+
+    def check_plans(self, options):
+        started = time.perf_counter()
+        data = seed(**{
+            name: options[name]
+            for name in ("users", "threads", "replies", "likes", "tags", "reports")
+        })
+        # Planner statistics, as a production database would have them.
+        with connection.cursor() as cursor:
+            cursor.execute("VACUUM ANALYZE" if connection.vendor == "postgresql" else "ANALYZE")
+        self.stderr.write(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+        explain = postgres_scans if connection.vendor == "postgresql" else sqlite_scans
+        client = Client()
+        client.force_login(data.moderator)
+        row_counts = {}
+        problems = 0
+        for name in options["views"]:
+            collector = SelectCollector()
+            with connection.execute_wrapper(collector):
+                response = VIEWS[name](client, data)
+            if response.status_code != 200:
+                raise CommandError(f"{name} returned {response.status_code}")
+
+            flagged = []
+            for sql, params in collector.statements:
+                for table, detail in explain(sql, params):
+                    if table not in row_counts:
+                        row_counts[table] = self.row_count(table)
+                    if row_counts[table] is None or row_counts[table] >= options["min_rows"]:
+                        flagged.append((table, detail, sql))
+
+            status = self.style.ERROR("FULL SCAN") if flagged else self.style.SUCCESS("ok")
+            self.stdout.write(f"{name:<18}{len(collector.statements):>4} queries  {status}")
+            for table, detail, sql in flagged:
+                rows = row_counts[table]
+                self.stdout.write(f"    {detail} ({rows if rows is not None else '?'} rows)")
+                self.stdout.write(f"    {sql[:300]}")
+            problems += len(flagged)
+        return problems
+
+    def row_count(self, table):
+        """
+        Rows in a table, or None when the name is a query alias.
+        """
+        if table not in connection.introspection.table_names():
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {connection.ops.quote_name(table)}")
+            return cursor.fetchone()[0]
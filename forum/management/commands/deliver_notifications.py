@@ -0,0 +1,62 @@
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+
+from forum.notifications import deliver_batch
+
+
+class Command(BaseCommand):
+    help = "Deliver queued notification emails from the outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=settings.FORUM_OUTBOX_MAX_ATTEMPTS,
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Seconds to sleep when the outbox is empty",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Drain the outbox once and exit",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = self.drain(options["batch_size"], options["max_attempts"])
+            if sent or failed:
+                self.stdout.write(f"Sent {sent}, failed {failed}")
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
+
+    def drain(self, batch_size, max_attempts):
+        """
+        Delivers batches over one connection until no due messages are left.
+        """
+        total_sent = total_failed = 0
+        connection = get_connection()
+        try:
+            # Opened here, sends reuse it rather than each connecting anew.
+            connection.open()
+        except Exception as exc:
+            # Each send then retries and records the error.
+            self.stderr.write(f"Could not connect to the mail server: {exc}")
+        try:
+            while True:
+                sent, failed = deliver_batch(connection, batch_size, max_attempts)
+                total_sent += sent
+                total_failed += failed
+                if sent + failed < batch_size:
+                    break
+        finally:
+            connection.close()
+        return total_sent, total_failed
@@ -0,0 +1,229 @@
+import json
+import math
+import platform
+import random
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from forum.models import Thread
+from forum.seeding import WORDS, seed
+
+
+def thread_list(client, rng, data):
+    return client.get(reverse("thread_list"), {"page": rng.randint(1, 5)})
+
+
+def thread_detail(client, rng, data):
+    return client.get(reverse("thread_detail", args=[rng.choice(data.thread_ids)]))
+
+
+def search_threads(client, rng, data):
+    query = " ".join(rng.sample(WORDS, rng.randint(1, 2)))
+    return client.get(reverse("search_threads"), {"q": query})
+
+
+def filter_by_tags(client, rng, data):
+    tags = rng.sample(data.tag_ids, min(len(data.tag_ids), rng.randint(1, 2)))
+    return client.get(reverse("filter_by_tags"), {"tags": tags})
+
+
+def like_thread(client, rng, data):
+    return client.get(reverse("like_thread", args=[rng.choice(data.open_thread_ids)]))
+
+
+def post_create(client, rng, data):
+    return client.post(
+        reverse("post_create", args=[rng.choice(data.open_thread_ids)]),
+        {"content": " ".join(rng.choice(WORDS) for _ in range(20))},
+    )
+
+
+def moderate(client, rng, data):
+    return client.get(reverse("moderate"))
+
+
+SCENARIOS = {
+    "thread_list": thread_list,
+    "thread_detail": thread_detail,
+    "search_threads": search_threads,
+    "filter_by_tags": filter_by_tags,
+    "like_thread": like_thread,
+    "post_create": post_create,
+    "moderate": moderate,
+}
+
+
+class QueryTimer:
+    """
+    Database execute wrapper counting queries and their time.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile of a sorted list.
+    """
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, cwd=settings.BASE_DIR, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database and report latency percentiles, query "
+        "counts and SQL time for the main forum views"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--threads", type=int, default=500)
+        parser.add_argument("--replies", type=int, default=5000)
+        parser.add_argument("--likes", type=int, default=10000)
+        parser.add_argument("--tags", type=int, default=20)
+        parser.add_argument("--reports", type=int, default=100)
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--views",
+            nargs="+",
+            choices=list(SCENARIOS),
+            default=list(SCENARIOS),
+        )
+        parser.add_argument("--output", help="Write the results as JSON to this file")
+
+    def handle(self, *args, **options):
+        if options["iterations"] < 1:
+            raise CommandError("--iterations must be at least 1")
+
+        setup_test_environment()
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # A private cache, and CPU-heavy steps run inline so that the
+            # queries they make are counted too.
+            with override_settings(
+                CACHES={"default": {
+                    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                    "LOCATION": "forum-bench",
+                }},
+                FORUM_CPU_POOL_SIZE=0,
+            ):
+                results = self.run_bench(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.report(results)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+                f.write("\n")
+            self.stdout.write(f"Wrote {options['output']}")
+
+    def run_bench(self, options):
+        dataset = {
+            name: options[name]
+            for name in ("users", "threads", "replies", "likes", "tags", "reports", "seed")
+        }
+        started = time.perf_counter()
+        data = seed(**dataset)
+        seconds = time.perf_counter() - started
+        self.stderr.write(f"Seeded in {seconds:.1f}s")
+
+        data.open_thread_ids = list(
+            Thread.objects.filter(id__in=data.thread_ids, is_locked=False)
+            .values_list("id", flat=True)
+        )
+        client = Client()
+        client.force_login(data.moderator)
+
+        views = {}
+        for name in options["views"]:
+            rng = random.Random(f"{options['seed']}:{name}")
+            scenario = SCENARIOS[name]
+            for _ in range(options["warmup"]):
+                scenario(client, rng, data)
+            views[name] = self.measure(client, rng, data, scenario, options["iterations"])
+
+        return {
+            "meta": {
+                "revision": git_revision(),
+                "database": connection.vendor,
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "iterations": options["iterations"],
+                "warmup": options["warmup"],
+            },
+            "dataset": dataset,
+            "views": views,
+        }
+
+    def measure(self, client, rng, data, scenario, iterations):
+        latencies = []
+        queries = []
+        sql_times = []
+        statuses = {}
+        for _ in range(iterations):
+            timer = QueryTimer()
+            with connection.execute_wrapper(timer):
+                started = time.perf_counter()
+                response = scenario(client, rng, data)
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(timer.count)
+            sql_times.append(timer.seconds * 1000)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+        latencies.sort()
+        queries.sort()
+        sql_times.sort()
+        return {
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "mean_ms": round(sum(latencies) / len(latencies), 3),
+            "queries_p50": percentile(queries, 50),
+            "queries_max": queries[-1],
+            "sql_ms_p50": round(percentile(sql_times, 50), 3),
+            "statuses": statuses,
+        }
+
+    def report(self, results):
+        self.stdout.write(
+            f"{'view':<16}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+            f"{'queries':>9}{'max q':>7}{'sql ms':>9}  statuses"
+        )
+        for name, row in results["views"].items():
+            statuses = ", ".join(f"{code}x{count}" for code, count in sorted(row["statuses"].items()))
+            self.stdout.write(
+                f"{name:<16}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}"
+                f"{row['queries_p50']:>9}{row['queries_max']:>7}{row['sql_ms_p50']:>9.2f}  {statuses}"
+            )
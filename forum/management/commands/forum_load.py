@@ -0,0 +1,442 @@
+import bisect
+import json
+import math
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from forum.seeding import WORDS
+
+from .forum_bench import git_revision, percentile
+
+# Upper bounds (ms) of the latency histogram buckets; the last is open.
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+DEFAULT_MIX = "list=25,page=10,read=35,search=10,like=10,reply=7,report=3"
+
+NEXT_LINK = re.compile(r'href="(\?(?:cursor|page)=[^"]+)">Next<')
+
+
+class Stats:
+    """
+    Latencies and statuses per endpoint, kept by each client thread and
+    merged at the end.
+    """
+
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+        self.errors = {}
+
+    def record(self, endpoint, started, status):
+        elapsed = (time.perf_counter() - started) * 1000
+        self.latencies.setdefault(endpoint, []).append(elapsed)
+        statuses = self.statuses.setdefault(endpoint, {})
+        statuses[status] = statuses.get(status, 0) + 1
+
+    def error(self, endpoint, exc):
+        errors = self.errors.setdefault(endpoint, {})
+        name = type(exc).__name__
+        errors[name] = errors.get(name, 0) + 1
+
+    def merge(self, other):
+        for endpoint, values in other.latencies.items():
+            self.latencies.setdefault(endpoint, []).extend(values)
+        for target, source in ((self.statuses, other.statuses), (self.errors, other.errors)):
+            for endpoint, counts in source.items():
+                merged = target.setdefault(endpoint, {})
+                for key, count in counts.items():
+                    merged[key] = merged.get(key, 0) + count
+
+    def summary(self, seconds):
+        endpoints = {}
+        for endpoint in sorted(set(self.latencies) | set(self.errors)):
+            latencies = sorted(self.latencies.get(endpoint, []))
+            histogram = [0] * (len(BUCKETS) + 1)
+            for value in latencies:
+                histogram[bisect.bisect_left(BUCKETS, value)] += 1
+            row = {
+                "requests": len(latencies),
+                "rps": round(len(latencies) / seconds, 2),
+                "statuses": {str(code): count for code, count in sorted(self.statuses.get(endpoint, {}).items())},
+                "errors": self.errors.get(endpoint, {}),
+                "histogram": histogram,
+            }
+            if latencies:
+                row.update(
+                    p50_ms=round(percentile(latencies, 50), 2),
+                    p95_ms=round(percentile(latencies, 95), 2),
+                    p99_ms=round(percentile(latencies, 99), 2),
+                    max_ms=round(latencies[-1], 2),
+                )
+            endpoints[endpoint] = row
+        return endpoints
+
+
+class LoadClient:
+    """
+    One logged-in user with its own session (cookies, CSRF token and
+    keep-alive connection), picking actions from the traffic mix.
+    """
+
+    def __init__(self, base_url, email, password, data, rng):
+        self.base_url = base_url
+        self.email = email
+        self.password = password
+        self.data = data
+        self.rng = rng
+        self.session = requests.Session()
+        self.stats = Stats()
+
+    def request(self, endpoint, method, path, **kwargs):
+        if method == "POST":
+            kwargs["data"] = {
+                **kwargs.get("data", {}),
+                "csrfmiddlewaretoken": self.session.cookies.get("csrftoken", ""),
+            }
+        started = time.perf_counter()
+        try:
+            response = self.session.request(
+                method, self.base_url + path, allow_redirects=False, timeout=30, **kwargs
+            )
+        except requests.RequestException as exc:
+            self.stats.error(endpoint, exc)
+            return None
+        self.stats.record(endpoint, started, response.status_code)
+        return response
+
+    def login(self):
+        """
+        Goes through the allauth login form: the GET sets the CSRF cookie,
+        the POST signs in and sets the session cookie.
+        """
+        self.request("login", "GET", "/accounts/login/")
+        response = self.request(
+            "login",
+            "POST",
+            "/accounts/login/",
+            data={"login": self.email, "password": self.password},
+        )
+        if response is None or response.status_code != 302:
+            status = response.status_code if response is not None else "no response"
+            raise CommandError(f"Could not log in as {self.email} ({status})")
+
+    def list(self):
+        self.request("list", "GET", "/")
+
+    def page(self):
+        """
+        Follows the Next link several pages deep, like someone digging
+        through older threads.
+        """
+        path = "/"
+        for _ in range(self.rng.randint(5, 20)):
+            response = self.request("page", "GET", path)
+            if response is None or response.status_code != 200:
+                return
+            match = NEXT_LINK.search(response.text)
+            if not match:
+                return
+            path = "/" + match.group(1).replace("&amp;", "&")
+
+    def read(self):
+        self.request("read", "GET", f"/thread/{self.pick_thread()}/")
+
+    def search(self):
+        query = " ".join(self.rng.sample(WORDS, self.rng.randint(1, 3)))
+        self.request("search", "GET", "/search/", params={"q": query})
+
+    def like(self):
+        self.request("like", "GET", f"/thread/{self.pick_thread()}/like/")
+
+    def reply(self):
+        content = " ".join(self.rng.choice(WORDS) for _ in range(self.rng.randint(5, 40)))
+        self.request(
+            "reply", "POST", f"/thread/{self.pick_thread()}/reply/", data={"content": content}
+        )
+
+    def report(self):
+        reason = " ".join(self.rng.choice(WORDS) for _ in range(6))
+        self.request(
+            "report", "POST", f"/post/{self.rng.choice(self.data['post_ids'])}/report/",
+            data={"reason": reason},
+        )
+
+    def pick_thread(self):
+        # Most traffic goes to a few hot threads.
+        threads = self.data["thread_ids"]
+        return threads[min(int(self.rng.paretovariate(1.2)) - 1, len(threads) - 1)]
+
+
+ACTIONS = ("list", "page", "read", "search", "like", "reply", "report")
+
+
+def parse_mix(value):
+    """
+    Parses "read=50,list=30,..." into ([action], [weight]).
+    """
+    actions, weights = [], []
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ACTIONS:
+            raise CommandError(f"Unknown action {name!r} in --mix; choose from {', '.join(ACTIONS)}")
+        try:
+            weight = float(weight)
+        except ValueError:
+            raise CommandError(f"Invalid weight for {name!r} in --mix")
+        if weight > 0:
+            actions.append(name)
+            weights.append(weight)
+    if not actions:
+        raise CommandError("--mix has no action with a positive weight")
+    return actions, weights
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Start the app under gunicorn (sync or uvicorn workers) against a seeded "
+        "database and drive it with concurrent logged-in clients, reporting "
+        "throughput and latency per endpoint as the worker count grows"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            nargs="+",
+            default=[1, 2, 4],
+            help="Worker counts to run, one load run each",
+        )
+        parser.add_argument("--asgi", action="store_true", help="Serve with uvicorn workers")
+        parser.add_argument("--clients", type=int, default=16, help="Concurrent clients")
+        parser.add_argument("--duration", type=float, default=30, help="Measured seconds per run")
+        parser.add_argument("--warmup", type=float, default=5, help="Unmeasured seconds per run")
+        parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Action weights (default {DEFAULT_MIX})")
+        parser.add_argument(
+            "--database-url",
+            help="Database to seed and serve from (default: a temporary SQLite file)",
+        )
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--threads", type=int, default=500)
+        parser.add_argument("--replies", type=int, default=5000)
+        parser.add_argument("--likes", type=int, default=10000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write the results as JSON to this file")
+
+    def handle(self, *args, **options):
+        if options["clients"] < 1 or options["duration"] <= 0:
+            raise CommandError("--clients and --duration must be positive")
+        mix = parse_mix(options["mix"])
+
+        with tempfile.TemporaryDirectory(prefix="forum-load-") as workdir:
+            env = self.server_env(options, workdir)
+            data = self.prepare_database(options, env)
+            runs = []
+            for workers in options["workers"]:
+                self.stderr.write(f"Running {workers} worker(s) for {options['duration']:g}s")
+                runs.append(self.run(workers, options, env, data, mix))
+
+        results = {
+            "meta": {
+                "revision": git_revision(),
+                "server": "uvicorn" if options["asgi"] else "gunicorn",
+                "clients": options["clients"],
+                "duration": options["duration"],
+                "mix": options["mix"],
+                "database": env["DATABASE_URL"].split(":", 1)[0],
+                "buckets_ms": list(BUCKETS),
+            },
+            "runs": runs,
+        }
+        self.report(results)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+                f.write("\n")
+            self.stdout.write(f"Wrote {options['output']}")
+
+    def server_env(self, options, workdir):
+        env = {
+            **os.environ,
+            "DATABASE_URL": options["database_url"] or f"sqlite:///{os.path.join(workdir, 'load.sqlite3')}",
+            "ALLOWED_HOSTS": "127.0.0.1,localhost",
+            # Every client logs in from 127.0.0.1.
+            "ACCOUNT_RATE_LIMITS": "off",
+            "FORUM_RATELIMIT_DIR": os.path.join(workdir, "ratelimit"),
+        }
+        if options["asgi"]:
+            env["FORUM_ASGI"] = "True"
+        # Workers must agree on cache versions, or they serve stale pages.
+        if "CACHE_BACKEND" not in os.environ:
+            env["CACHE_BACKEND"] = "django.core.cache.backends.filebased.FileBasedCache"
+            env["CACHE_LOCATION"] = os.path.join(workdir, "cache")
+        return env
+
+    def manage(self, env, *args):
+        result = subprocess.run(
+            [sys.executable, "manage.py", *args],
+            capture_output=True, text=True, env=env, cwd=settings.BASE_DIR,
+        )
+        if result.returncode:
+            raise CommandError(f"manage.py {args[0]} failed:\n{result.stderr.strip()}")
+        return result.stdout
+
+    def prepare_database(self, options, env):
+        started = time.perf_counter()
+        self.manage(env, "migrate", "--noinput")
+        output = self.manage(
+            env,
+            "forum_seed",
+            "--json",
+            *(f"--{name}={options[name]}" for name in ("users", "threads", "replies", "likes", "seed")),
+        )
+        self.stderr.write(f"Seeded in {time.perf_counter() - started:.1f}s")
+        return json.loads(output.strip().splitlines()[-1])
+
+    def start_server(self, workers, options, env):
+        port = free_port()
+        command = [
+            sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+            "--workers", str(workers), "--bind", f"127.0.0.1:{port}",
+        ]
+        if options["asgi"]:
+            command += ["-k", "uvicorn_worker.UvicornWorker", "forums.asgi:application"]
+        server = subprocess.Popen(
+            command, env=env, cwd=settings.BASE_DIR,
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"gunicorn exited:\n{server.stderr.read().strip()}")
+            try:
+                requests.get(base_url + "/accounts/login/", timeout=1)
+                return server, base_url
+            except requests.RequestException:
+                time.sleep(0.2)
+        self.stop_server(server)
+        raise CommandError("gunicorn did not start within 60s")
+
+    def stop_server(self, server):
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+    def run(self, workers, options, env, data, mix):
+        server, base_url = self.start_server(workers, options, env)
+        try:
+            clients = [
+                LoadClient(
+                    base_url,
+                    data["emails"][index % len(data["emails"])],
+                    data["password"],
+                    data,
+                    random.Random(f"{options['seed']}:{workers}:{index}"),
+                )
+                for index in range(options["clients"])
+            ]
+            for client in clients:
+                client.login()
+
+            actions, weights = mix
+            started = time.monotonic()
+            measure_from = started + options["warmup"]
+            stop_at = measure_from + options["duration"]
+
+            def act(client):
+                getattr(client, client.rng.choices(actions, weights)[0])()
+
+            def drive(client):
+                while time.monotonic() < measure_from:
+                    act(client)
+                # Drop what was recorded during the warm-up.
+                client.stats = Stats()
+                while time.monotonic() < stop_at:
+                    act(client)
+
+            threads = [threading.Thread(target=drive, args=(client,)) for client in clients]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            self.stop_server(server)
+
+        # Requests in flight when the window closed end a little after it.
+        seconds = options["duration"]
+        stats = Stats()
+        for client in clients:
+            stats.merge(client.stats)
+        endpoints = stats.summary(seconds)
+        latencies = sorted(value for values in stats.latencies.values() for value in values)
+        return {
+            "workers": workers,
+            "requests": len(latencies),
+            "rps": round(len(latencies) / seconds, 2),
+            "p95_ms": round(percentile(latencies, 95), 2) if latencies else None,
+            "endpoints": endpoints,
+        }
+
+    def report(self, results):
+        labels = [f"<={bound}" for bound in BUCKETS] + [f">{BUCKETS[-1]}"]
+        for run in results["runs"]:
+            self.stdout.write("")
+            self.stdout.write(
+                f"{run['workers']} worker(s), {results['meta']['server']}: "
+                f"{run['requests']} requests, {run['rps']:.1f} req/s"
+            )
+            self.stdout.write(
+                f"  {'endpoint':<10}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  statuses"
+            )
+            for name, row in run["endpoints"].items():
+                outcomes = dict(row["statuses"], **row["errors"])
+                statuses = ", ".join(f"{code}x{count}" for code, count in outcomes.items())
+                if "p50_ms" in row:
+                    latency = f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}"
+                else:
+                    latency = f"{'-':>9}{'-':>9}{'-':>9}"
+                self.stdout.write(f"  {name:<10}{row['rps']:>9.1f}{latency}  {statuses}")
+            self.stdout.write("  latency histogram (ms):")
+            for name, row in run["endpoints"].items():
+                buckets = "  ".join(
+                    f"{label}:{count}" for label, count in zip(labels, row["histogram"]) if count
+                )
+                self.stdout.write(f"    {name:<10}{buckets}")
+
+        if len(results["runs"]) > 1:
+            self.stdout.write("")
+            self.stdout.write(f"{'workers':>7}{'req/s':>10}{'gain':>8}{'p95 ms':>9}")
+            previous = None
+            for run in results["runs"]:
+                p95 = run["p95_ms"] if run["p95_ms"] is not None else math.nan
+                gain = ""
+                note = ""
+                if previous:
+                    ratio = run["rps"] / previous["rps"] if previous["rps"] else math.inf
+                    gain = f"{ratio:.2f}x"
+                    # Less than 10% more throughput from more workers.
+                    if ratio < 1.1:
+                        note = "  saturated"
+                self.stdout.write(f"{run['workers']:>7}{run['rps']:>10.1f}{gain:>8}{p95:>9.1f}{note}")
+                previous = run
@@ -0,0 +1,41 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from forum.seeding import seed
+
+
+class Command(BaseCommand):
+    help = "Fill an empty (throwaway) database with synthetic forum data"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--threads", type=int, default=500)
+        parser.add_argument("--replies", type=int, default=5000)
+        parser.add_argument("--likes", type=int, default=10000)
+        parser.add_argument("--tags", type=int, default=20)
+        parser.add_argument("--reports", type=int, default=100)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            help="Print the seeded accounts and ids as JSON",
+        )
+
+    def handle(self, *args, **options):
+        data = seed(
+            users=options["users"],
+            threads=options["threads"],
+            replies=options["replies"],
+            likes=options["likes"],
+            tags=options["tags"],
+            reports=options["reports"],
+            seed=options["seed"],
+        )
+        if options["json"]:
+            self.stdout.write(json.dumps(data.as_dict()))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Seeded {len(data.emails)} users, {len(data.thread_ids)} threads "
+                f"and {len(data.post_ids)} replies"
+            ))
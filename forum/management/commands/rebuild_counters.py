@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from forum.likes import rebuild_counters
+from forum.models import Post, Thread
+
+
+class Command(BaseCommand):
+    help = "Recompute denormalized like and reply counters on threads and posts"
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic():
+            rebuild_counters(Thread, Post)
+
+        self.stdout.write(self.style.SUCCESS("Like and reply counters rebuilt"))
@@ -0,0 +1,56 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+
+from forum.models import Profile
+from forum.notifications import build_digests
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue hourly or daily notification digests into the outbox, or with "
+        "--schedule keep running and queue both when they are due"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "frequency",
+            nargs="?",
+            choices=[Profile.HOURLY, Profile.DAILY],
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--schedule",
+            action="store_true",
+            help=(
+                "Queue hourly digests at the top of every hour and daily ones "
+                "at FORUM_DIGEST_DAILY_HOUR, until stopped"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if options["schedule"]:
+            self.run_schedule(options["batch_size"])
+        elif options["frequency"]:
+            self.send(options["frequency"], options["batch_size"])
+        else:
+            raise CommandError("Give a frequency (hourly or daily) or --schedule")
+
+    def send(self, frequency, batch_size):
+        digests = build_digests(frequency, batch_size)
+        self.stdout.write(f"Queued {digests} {frequency} digests")
+
+    def run_schedule(self, batch_size):
+        while True:
+            now = timezone.localtime()
+            due = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+            time.sleep((due - now).total_seconds())
+            self.send(Profile.HOURLY, batch_size)
+            if due.hour == settings.FORUM_DIGEST_DAILY_HOUR:
+                self.send(Profile.DAILY, batch_size)
+            # Do not hold a connection through the hour of sleep.
+            close_old_connections()
@@ -0,0 +1,71 @@
+import re
+import threading
+
+from .cache import USER_DIRECTORY, bump_version, get_version
+from .utils import MENTION_REGEX
+
+
+class UsernameResolver:
+    """
+    Maps usernames to user ids, cached per process. The cache is dropped by
+    invalidate() (called when a User is saved or deleted) and whenever
+    another process has bumped the USER_DIRECTORY version.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._version = None
+
+    def invalidate(self):
+        with self._lock:
+            self._ids = {}
+        bump_version(USER_DIRECTORY)
+
+    def resolve(self, usernames):
+        """
+        Returns {username: user id} for the usernames that exist.
+        """
+        from django.contrib.auth.models import User
+
+        version = get_version(USER_DIRECTORY)
+        with self._lock:
+            if version != self._version:
+                self._ids = {}
+                self._version = version
+            ids = self._ids
+
+        missing = [username for username in usernames if username not in ids]
+        if missing:
+            ids.update(
+                User.objects
+                .filter(username__in=missing)
+                .values_list("username", "id")
+            )
+        return {username: ids[username] for username in usernames if username in ids}
+
+
+username_resolver = UsernameResolver()
+
+
+def parse_mentions(text):
+    return set(re.findall(MENTION_REGEX, text))
+
+
+def record_mentions(post):
+    """
+    Stores a Mention for every existing user @mentioned in the post, other
+    than its author, and returns their ids.
+    """
+    from .models import Mention
+
+    user_ids = set(username_resolver.resolve(parse_mentions(post.content)).values())
+    user_ids.discard(post.author_id)
+    Mention.objects.bulk_create(
+        [
+            Mention(post=post, user_id=user_id, created_at=post.created_at)
+            for user_id in user_ids
+        ],
+        ignore_conflicts=True,
+    )
+    return user_ids
@@ -0,0 +1,125 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:34
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# The SQL is copied here rather than imported from forum.search.fts, so
+# this migration keeps doing what it did when later code changes.
+
+POSTGRES_CREATE = [
+    """
+    CREATE OR REPLACE FUNCTION forum_thread_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW.content, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    DROP TRIGGER IF EXISTS forum_thread_search_vector_trigger ON forum_thread
+    """,
+    """
+    CREATE TRIGGER forum_thread_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, content ON forum_thread
+    FOR EACH ROW EXECUTE FUNCTION forum_thread_search_vector_update()
+    """,
+    """
+    UPDATE forum_thread SET title = title
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS forum_thread_search_vector_gin
+    ON forum_thread USING GIN (search_vector)
+    """,
+]
+
+POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS forum_thread_search_vector_gin",
+    "DROP TRIGGER IF EXISTS forum_thread_search_vector_trigger ON forum_thread",
+    "DROP FUNCTION IF EXISTS forum_thread_search_vector_update()",
+]
+
+SQLITE_CREATE = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS forum_thread_fts USING fts5(
+        title, content,
+        content='forum_thread', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS forum_thread_fts_insert AFTER INSERT ON forum_thread BEGIN
+        INSERT INTO forum_thread_fts(rowid, title, content)
+        VALUES (new.id, new.title, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS forum_thread_fts_delete AFTER DELETE ON forum_thread BEGIN
+        INSERT INTO forum_thread_fts(forum_thread_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS forum_thread_fts_update AFTER UPDATE OF title, content ON forum_thread BEGIN
+        INSERT INTO forum_thread_fts(forum_thread_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO forum_thread_fts(rowid, title, content)
+        VALUES (new.id, new.title, new.content);
+    END
+    """,
+    """
+    INSERT INTO forum_thread_fts(forum_thread_fts) VALUES ('rebuild')
+    """,
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS forum_thread_fts_insert",
+    "DROP TRIGGER IF EXISTS forum_thread_fts_delete",
+    "DROP TRIGGER IF EXISTS forum_thread_fts_update",
+    "DROP TABLE IF EXISTS forum_thread_fts",
+]
+
+
+def sqlite_fts5_available(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        return "ENABLE_FTS5" in {row[0] for row in cursor.fetchall()}
+
+
+def run(connection, statements):
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def install_full_text_search(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == "postgresql":
+        run(connection, POSTGRES_CREATE)
+    elif connection.vendor == "sqlite" and sqlite_fts5_available(connection):
+        run(connection, SQLITE_CREATE)
+
+
+def uninstall_full_text_search(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == "postgresql":
+        run(connection, POSTGRES_DROP)
+    elif connection.vendor == "sqlite":
+        run(connection, SQLITE_DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0012_alter_resource_link'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thread',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(install_full_text_search, uninstall_full_text_search),
+    ]
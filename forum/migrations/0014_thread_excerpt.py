@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:35
+
+from django.db import migrations, models
+from django.db.models.functions import Substr
+
+
+def backfill_excerpts(apps, schema_editor):
+    Thread = apps.get_model("forum", "Thread")
+    Thread.objects.update(excerpt=Substr("content", 1, 500))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0013_thread_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thread',
+            name='excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=500),
+        ),
+        migrations.RunPython(backfill_excerpts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:39
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+# Counted here rather than with forum.likes.rebuild_counters, so this
+# migration keeps doing what it did when later code changes.
+def count(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset
+            .filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(total=Count("*"))
+            .values("total")
+        ),
+        Value(0),
+    )
+
+
+def populate_counters(apps, schema_editor):
+    Thread = apps.get_model("forum", "Thread")
+    Post = apps.get_model("forum", "Post")
+    ThreadLikes = Thread._meta.get_field("likes").remote_field.through
+    PostLikes = Post._meta.get_field("likes").remote_field.through
+
+    Thread.objects.update(
+        like_count=count(ThreadLikes.objects.all(), "thread"),
+        reply_count=count(Post.objects.filter(is_deleted=False), "thread"),
+    )
+    Post.objects.update(like_count=count(PostLikes.objects.all(), "post"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0014_thread_excerpt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0015_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='content_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='content_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
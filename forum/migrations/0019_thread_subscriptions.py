@@ -0,0 +1,71 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:46
+
+import re
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from forum.utils import MENTION_REGEX
+
+
+def subscribe_participants(apps, schema_editor):
+    """
+    Subscribes thread creators, everyone who replied and everyone mentioned
+    in a reply, matching who was notified before subscriptions existed.
+    """
+    Thread = apps.get_model("forum", "Thread")
+    Post = apps.get_model("forum", "Post")
+    User = apps.get_model("auth", "User")
+    ThreadSubscription = apps.get_model("forum", "ThreadSubscription")
+
+    pairs = set(Thread.objects.values_list("id", "creator_id"))
+    pairs.update(Post.objects.values_list("thread_id", "author_id").distinct())
+
+    mentions = set()
+    for thread_id, content in Post.objects.filter(content__contains="@").values_list("thread_id", "content").iterator():
+        mentions.update((thread_id, username) for username in re.findall(MENTION_REGEX, content))
+    usernames = sorted({username for _, username in mentions})
+    user_ids = {}
+    for start in range(0, len(usernames), 500):
+        user_ids.update(
+            User.objects
+            .filter(username__in=usernames[start:start + 500])
+            .values_list("username", "id")
+        )
+    pairs.update(
+        (thread_id, user_ids[username])
+        for thread_id, username in mentions
+        if username in user_ids
+    )
+
+    ThreadSubscription.objects.bulk_create(
+        [ThreadSubscription(thread_id=thread_id, user_id=user_id) for thread_id, user_id in pairs],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0018_notification_digests'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThreadSubscription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('muted', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('thread', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subscriptions', to='forum.thread')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='thread_subscriptions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('thread', 'user'), name='unique_thread_subscription')],
+            },
+        ),
+        migrations.RunPython(subscribe_participants, migrations.RunPython.noop),
+    ]
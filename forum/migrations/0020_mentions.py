@@ -0,0 +1,69 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:48
+
+import re
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from forum.utils import MENTION_REGEX
+
+
+def record_existing_mentions(apps, schema_editor):
+    Post = apps.get_model("forum", "Post")
+    User = apps.get_model("auth", "User")
+    Mention = apps.get_model("forum", "Mention")
+
+    posts = (
+        Post.objects
+        .filter(content__contains="@")
+        .values_list("id", "author_id", "created_at", "content")
+    )
+    mentions = [
+        (post_id, author_id, created_at, username)
+        for post_id, author_id, created_at, content in posts.iterator()
+        for username in set(re.findall(MENTION_REGEX, content))
+    ]
+    usernames = sorted({username for *_, username in mentions})
+    user_ids = {}
+    for start in range(0, len(usernames), 500):
+        user_ids.update(
+            User.objects
+            .filter(username__in=usernames[start:start + 500])
+            .values_list("username", "id")
+        )
+
+    Mention.objects.bulk_create(
+        [
+            Mention(post_id=post_id, user_id=user_ids[username], created_at=created_at)
+            for post_id, author_id, created_at, username in mentions
+            if user_ids.get(username, author_id) != author_id
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0019_thread_subscriptions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Mention',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mentions', to='forum.post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mentions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-created_at', '-id'], name='forum_menti_user_id_25fe40_idx')],
+                'constraints': [models.UniqueConstraint(fields=('post', 'user'), name='unique_mention')],
+            },
+        ),
+        migrations.RunPython(record_existing_mentions, migrations.RunPython.noop),
+    ]
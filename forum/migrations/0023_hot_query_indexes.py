@@ -0,0 +1,79 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class AddIndexConcurrentlyOnPostgres(AddIndexConcurrently):
+    """
+    CREATE INDEX CONCURRENTLY on PostgreSQL, so the large tables stay
+    writable while the index builds; a plain AddIndex elsewhere.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+def create_tag_thread_index(apps, schema_editor):
+    concurrently = "CONCURRENTLY " if schema_editor.connection.vendor == "postgresql" else ""
+    schema_editor.execute(
+        f"CREATE INDEX {concurrently}thread_tags_tag_thread_idx "
+        "ON forum_thread_tags (tag_id, thread_id)"
+    )
+
+
+def drop_tag_thread_index(apps, schema_editor):
+    concurrently = "CONCURRENTLY " if schema_editor.connection.vendor == "postgresql" else ""
+    schema_editor.execute(f"DROP INDEX {concurrently}thread_tags_tag_thread_idx")
+
+
+class Migration(migrations.Migration):
+    # Indexes on PostgreSQL are built concurrently, which cannot run inside
+    # a transaction. Each build still waits for transactions already
+    # writing to its table to finish, but does not block new writes.
+    atomic = False
+
+    dependencies = [
+        ('forum', '0022_request_captures'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name='post',
+            index=models.Index(fields=['thread', 'created_at'], name='post_thread_created_idx'),
+        ),
+        # Only once its replacement exists: dropping the thread_id index
+        # is quick but takes a brief exclusive lock on forum_post.
+        migrations.AlterField(
+            model_name='post',
+            name='thread',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='posts', to='forum.thread'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['thread', 'id'], name='post_live_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='report',
+            index=models.Index(condition=models.Q(('resolved', False)), fields=['post', 'created_at'], name='report_unresolved_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='thread',
+            index=models.Index(fields=['created_at', 'id'], name='thread_created_idx'),
+        ),
+        # Tag pages and filters go from tag to threads; the auto-created
+        # table only has (thread_id, tag_id) and a tag_id-only index.
+        migrations.RunPython(create_tag_thread_index, drop_tag_thread_index, atomic=False),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0024_post_is_hidden'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ratelimitcounter',
+            index=models.Index(fields=['window_start'], name='rate_limit_window_idx'),
+        ),
+    ]
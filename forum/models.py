@@ -1,15 +1,65 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Exists, F, OuterRef, Value
 
 # Create your models here.
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
+from django.utils import timezone
 from django.utils.text import slugify
+from .cache import bump_thread_version
+from .rendering import render_markdown
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
+def preserve_counters(instance, kwargs, counters):
+    """
+    Keeps a full save() of an existing row from writing back counters that
+    are maintained with F() updates (or flags changed only by conditional
+    updates), which could undo concurrent changes.
+    """
+    if (
+        instance._state.adding
+        or kwargs.get("force_insert")
+        or kwargs.get("update_fields") is not None
+    ):
+        return
+    kwargs["update_fields"] = [
+        field.name
+        for field in instance._meta.concrete_fields
+        if not field.primary_key and field.name not in counters
+    ]
+
+class LikeableQuerySet(models.QuerySet):
+    def with_liked_by(self, user):
+        """
+        Annotates each row with liked_by_me, whether user likes it, as an
+        EXISTS subquery of the same query rather than one query per row.
+        """
+        if not user.is_authenticated:
+            return self.annotate(liked_by_me=Value(False))
+        field = self.model._meta.get_field("likes")
+        likes = field.remote_field.through.objects.filter(**{
+            f"{field.m2m_field_name()}_id": OuterRef("pk"),
+            f"{field.m2m_reverse_field_name()}_id": user.pk,
+        })
+        return self.annotate(liked_by_me=Exists(likes))
+
 class Profile(models.Model):
+    IMMEDIATE = "immediate"
+    HOURLY = "hourly"
+    DAILY = "daily"
+    FREQUENCY_CHOICES = [
+        (IMMEDIATE, "Immediately"),
+        (HOURLY, "Hourly digest"),
+        (DAILY, "Daily digest"),
+    ]
+
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     full_name = models.CharField(max_length=150)
     avatar = models.URLField(blank=True)
+    notification_frequency = models.CharField(
+        max_length=10, choices=FREQUENCY_CHOICES, default=IMMEDIATE
+    )
 
     def __str__(self):
         return self.user.email
@@ -110,6 +160,8 @@ class Thread(models.Model):
     )
     title = models.CharField(max_length=200)
     content = models.TextField(blank = False)
+    content_html = models.TextField(blank=True, editable=False)
+    excerpt = models.CharField(max_length=500, blank=True, editable=False)
     creator = models.ForeignKey(
     User,
     on_delete=models.CASCADE,
@@ -118,15 +170,39 @@ class Thread(models.Model):
     is_locked = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     tags = models.ManyToManyField(Tag, blank=True, related_name="threads")
+    # Denormalized counters, maintained by forum.likes.toggle_like and reply
+    # creation/deletion; rebuild with `manage.py rebuild_counters`.
+    like_count = models.PositiveIntegerField(default=0, editable=False)
+    reply_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = LikeableQuerySet.as_manager()
+    # Maintained by a database trigger on PostgreSQL (see forum.search.fts);
+    # unused on other databases.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        preserve_counters(self, kwargs, ("like_count", "reply_count"))
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "content" in update_fields:
+            self.excerpt = self.content[:500]
+            self.content_html = render_markdown(self.content)
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "excerpt", "content_html"}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.title
     
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Listing order (-created_at, -id), scanned backwards.
+            models.Index(fields=["created_at", "id"], name="thread_created_idx"),
+        ]
     
 class Post(models.Model):
-    thread = models.ForeignKey(Thread, on_delete=models.CASCADE, related_name="posts")
+    # Indexed by the (thread, created_at) index below.
+    thread = models.ForeignKey(Thread, on_delete=models.CASCADE, related_name="posts", db_index=False)
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -134,20 +210,100 @@ class Post(models.Model):
     )
 
     content = models.TextField()
+    content_html = models.TextField(blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     is_deleted = models.BooleanField(default=False)
+    # Hidden from thread pages once reported by FORUM_REPORT_HIDE_THRESHOLD
+    # people, until a moderator dismisses the reports.
+    is_hidden = models.BooleanField(default=False)
 
     likes = models.ManyToManyField(
         User,
         blank=True,
         related_name="liked_posts"
     )
+    like_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = LikeableQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        # is_deleted changes only through soft_delete() and restore(),
+        # which keep the thread's reply_count in step.
+        preserve_counters(self, kwargs, ("like_count", "is_deleted"))
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "content" in update_fields:
+            self.content_html = render_markdown(self.content)
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "content_html"}
+        # A new reply commits together with its count (signals.count_new_reply).
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def soft_delete(self):
+        """
+        Marks the post deleted and drops it from the thread's reply count.
+        Returns False if it was already deleted.
+        """
+        with transaction.atomic():
+            updated = Post.objects.filter(pk=self.pk, is_deleted=False).update(
+                is_deleted=True
+            )
+            if updated:
+                Thread.objects.filter(pk=self.thread_id).update(
+                    reply_count=F("reply_count") - 1
+                )
+                thread_id = self.thread_id
+                transaction.on_commit(lambda: bump_thread_version(thread_id))
+        self.is_deleted = True
+        return bool(updated)
+
+    def restore(self):
+        """
+        Undoes soft_delete(), counting the post as a reply again. Returns
+        False if it was not deleted.
+        """
+        with transaction.atomic():
+            updated = Post.objects.filter(pk=self.pk, is_deleted=True).update(
+                is_deleted=False
+            )
+            if updated:
+                Thread.objects.filter(pk=self.thread_id).update(
+                    reply_count=F("reply_count") + 1
+                )
+                thread_id = self.thread_id
+                transaction.on_commit(lambda: bump_thread_version(thread_id))
+        self.is_deleted = False
+        return bool(updated)
+
+    def set_hidden(self, hidden):
+        """
+        Hides or unhides the post. Returns False if it already was.
+        """
+        updated = Post.objects.filter(pk=self.pk, is_hidden=not hidden).update(
+            is_hidden=hidden
+        )
+        if updated:
+            thread_id = self.thread_id
+            transaction.on_commit(lambda: bump_thread_version(thread_id))
+        self.is_hidden = hidden
+        return bool(updated)
 
     def __str__(self):
         return f"Post by {self.author.email}"
     
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Thread pages.
+            models.Index(fields=["thread", "created_at"], name="post_thread_created_idx"),
+            # Live replies, newest reply id and reply counts: only posts
+            # that are not deleted, and covering those queries.
+            models.Index(
+                fields=["thread", "id"],
+                condition=models.Q(is_deleted=False),
+                name="post_live_idx",
+            ),
+        ]
 
 class Report(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
@@ -156,6 +312,149 @@ class Report(models.Model):
     resolved = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # The moderation queue only ever reads unresolved reports.
+            models.Index(
+                fields=["post", "created_at"],
+                condition=models.Q(resolved=False),
+                name="report_unresolved_idx",
+            ),
+        ]
+
+class RateLimitCounter(models.Model):
+    """
+    Requests seen for one rate limit key in one fixed window, shared by all
+    workers (forum.ratelimit.DatabaseStore).
+    """
+    key = models.CharField(max_length=255)
+    window_start = models.BigIntegerField()
+    hits = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["key", "window_start"], name="unique_rate_limit_window")
+        ]
+        indexes = [
+            # Purging expired windows (forum.ratelimit).
+            models.Index(fields=["window_start"], name="rate_limit_window_idx"),
+        ]
+
+class OutboxMessage(models.Model):
+    """
+    An email waiting to be delivered by `manage.py deliver_notifications`.
+    """
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (SENT, "Sent"),
+        (FAILED, "Failed"),
+    ]
+
+    recipient = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.recipient}"
+
+class Mention(models.Model):
+    """
+    A user @mentioned in a post. created_at is copied from the post so the
+    "my mentions" feed is paged on this table's own index.
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="mentions")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="mentions")
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["post", "user"], name="unique_mention")
+        ]
+        indexes = [models.Index(fields=["user", "-created_at", "-id"])]
+
+class ThreadSubscription(models.Model):
+    """
+    A user who gets notified about a thread, unless they muted it.
+    """
+    thread = models.ForeignKey(Thread, on_delete=models.CASCADE, related_name="subscriptions")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="thread_subscriptions")
+    muted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["thread", "user"], name="unique_thread_subscription")
+        ]
+
+    def __str__(self):
+        return f"{self.user} -> {self.thread}"
+
+class PendingNotification(models.Model):
+    """
+    A notification held back for a user's hourly or daily digest.
+    """
+    REPLY = "reply"
+    MENTION = "mention"
+    LOCK = "lock"
+    KIND_CHOICES = [
+        (REPLY, "Reply"),
+        (MENTION, "Mention"),
+        (LOCK, "Lock status"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="pending_notifications")
+    thread = models.ForeignKey(Thread, on_delete=models.CASCADE, related_name="+")
+    actor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    excerpt = models.CharField(max_length=300, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "thread", "created_at"])]
+
+class RequestCapture(models.Model):
+    """
+    A profiled or slow request (forum.profiling). Only the newest
+    FORUM_CAPTURE_LIMIT are kept.
+    """
+    PROFILE = "profile"
+    SLOW = "slow"
+    KIND_CHOICES = [
+        (PROFILE, "Profile"),
+        (SLOW, "Slow request"),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    view_name = models.CharField(max_length=200)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    status_code = models.PositiveSmallIntegerField()
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField()
+    sql_ms = models.FloatField()
+    # [{"fingerprint", "sql", "count", "ms"}] per normalized statement.
+    queries = models.JSONField(default=list)
+    duplicate_queries = models.JSONField(default=list)
+    stacks = models.TextField(blank=True)
+    profile = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
@@ -1,14 +1,271 @@
-from django.core.mail import send_mail
+from datetime import timedelta
+from itertools import groupby
+
 from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage
+from django.db import transaction
+from django.template.defaultfilters import pluralize
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .instrumentation import timed
+from .models import OutboxMessage, PendingNotification, Profile, ThreadSubscription
 
 
-def send_notification_email(subject, message, recipients):
+@timed("notify")
+def queue_notification_email(subject, message, recipients):
+    """
+    Queues one outbox message per recipient once the current transaction
+    commits. Delivery happens in `manage.py deliver_notifications`.
+    """
+    recipients = sorted({recipient for recipient in recipients if recipient})
     if not recipients:
         return
-    send_mail(
-        subject=subject,
-        message=message,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=list(set(recipients)),
-        fail_silently=True,
+    messages = [
+        OutboxMessage(recipient=recipient, subject=subject[:255], body=message)
+        for recipient in recipients
+    ]
+    transaction.on_commit(lambda: OutboxMessage.objects.bulk_create(messages))
+
+
+def subscribe(thread, user_ids):
+    """
+    Subscribes users to a thread. Existing subscriptions, including muted
+    ones, are left as they are.
+    """
+    ThreadSubscription.objects.bulk_create(
+        [ThreadSubscription(thread=thread, user_id=user_id) for user_id in user_ids],
+        ignore_conflicts=True,
+    )
+
+
+def subscriber_ids(thread, exclude=()):
+    """
+    Ids of users subscribed to a thread who have not muted it.
+    """
+    return set(
+        ThreadSubscription.objects
+        .filter(thread=thread, muted=False)
+        .exclude(user_id__in=exclude)
+        .values_list("user_id", flat=True)
+    )
+
+
+@timed("notify")
+def notify_users(user_ids, thread, kind, subject, message, actor=None, excerpt=""):
+    """
+    Emails users who want immediate notifications and holds the event back
+    for everyone on an hourly or daily digest.
+    """
+    if not user_ids:
+        return
+    immediate = []
+    pending = []
+    users = (
+        User.objects
+        .filter(id__in=user_ids)
+        .exclude(email="")
+        .values_list("id", "email", "profile__notification_frequency")
+    )
+    for user_id, email, frequency in users:
+        if frequency in (None, Profile.IMMEDIATE):
+            immediate.append(email)
+        else:
+            pending.append(PendingNotification(
+                user_id=user_id,
+                thread=thread,
+                actor=actor,
+                kind=kind,
+                excerpt=excerpt[:300],
+            ))
+
+    queue_notification_email(subject, message, immediate)
+    if pending:
+        transaction.on_commit(lambda: PendingNotification.objects.bulk_create(pending))
+
+
+def summarize_thread(thread, notifications):
+    replies = [n for n in notifications if n.kind == PendingNotification.REPLY]
+    mentions = [n for n in notifications if n.kind == PendingNotification.MENTION]
+    locks = [n for n in notifications if n.kind == PendingNotification.LOCK]
+    authors = sorted({n.actor.username for n in replies + mentions if n.actor})
+    latest = (mentions or replies or [None])[-1]
+    return {
+        "thread": thread,
+        "replies": len(replies),
+        "mentions": len(mentions),
+        "authors": authors,
+        "status": locks[-1].excerpt if locks else "",
+        "excerpt": latest.excerpt if latest else "",
+    }
+
+
+def build_digests(frequency, batch_size=500, user_id=None):
+    """
+    Turns every pending notification of users on the given frequency (or,
+    with user_id, of that user, titled as a `frequency` digest) into one
+    digest email per user, grouped by thread. Returns the number of
+    digests queued.
+    """
+    template = get_template("forum/email/digest.txt")
+    pending = PendingNotification.objects.filter(created_at__lte=timezone.now())
+    if user_id is None:
+        pending = pending.filter(user__profile__notification_frequency=frequency)
+    else:
+        pending = pending.filter(user_id=user_id)
+    pending = (
+        pending
+        .select_related("user", "thread", "actor")
+        .only(
+            "id", "kind", "excerpt", "created_at",
+            "user__id", "user__username", "user__email",
+            "thread__id", "thread__title",
+            "actor__id", "actor__username",
+        )
+        .order_by("user_id", "thread_id", "created_at")
+    )
+
+    digests = 0
+    with transaction.atomic():
+        messages = []
+        handled = []
+        for user, user_rows in groupby(pending.iterator(chunk_size=2000), key=lambda n: n.user):
+            user_rows = list(user_rows)
+            handled.extend(n.id for n in user_rows)
+            threads = [
+                summarize_thread(thread, list(rows))
+                for thread, rows in groupby(user_rows, key=lambda n: n.thread)
+            ]
+            if not user.email:
+                continue
+            updates = len(user_rows)
+            messages.append(OutboxMessage(
+                recipient=user.email,
+                subject=(
+                    f"Your {frequency} forum digest: {updates} "
+                    f"update{pluralize(updates)} in {len(threads)} "
+                    f"thread{pluralize(len(threads))}"
+                ),
+                body=template.render({
+                    "user": user,
+                    "frequency": frequency,
+                    "threads": threads,
+                }),
+            ))
+            digests += 1
+            if len(messages) >= batch_size:
+                OutboxMessage.objects.bulk_create(messages)
+                messages = []
+
+        OutboxMessage.objects.bulk_create(messages)
+        for start in range(0, len(handled), batch_size):
+            PendingNotification.objects.filter(
+                id__in=handled[start:start + batch_size]
+            ).delete()
+
+    return digests
+
+
+def flush_digest(user_id):
+    """
+    Queues whatever a user's digest was holding as a final digest, for
+    users who switched to immediate emails (their held notifications would
+    otherwise never be sent).
+    """
+    return build_digests("final", user_id=user_id)
+
+
+def retry_delay(attempts):
+    return timedelta(
+        seconds=min(
+            settings.FORUM_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1),
+            settings.FORUM_OUTBOX_MAX_RETRY_DELAY,
+        )
+    )
+
+
+def reopen(connection):
+    """
+    Replaces a possibly broken connection with a fresh one. If that fails
+    too, the next send opens its own (and records the error if it can't).
+    """
+    connection.close()
+    try:
+        connection.open()
+    except Exception:
+        pass
+
+
+def claim_batch(batch_size):
+    """
+    Leases up to batch_size due messages to this worker for
+    FORUM_OUTBOX_LEASE seconds and returns them, in a short transaction.
+
+    Rows are picked with SELECT ... FOR UPDATE SKIP LOCKED where supported,
+    and only rows still due when the lease is written are claimed, so
+    several workers can drain the outbox without sending twice. Rows of a
+    worker that dies mid-batch become due again once the lease runs out.
+    """
+    now = timezone.now()
+    lease_until = now + timedelta(seconds=settings.FORUM_OUTBOX_LEASE)
+    with transaction.atomic():
+        ids = list(
+            OutboxMessage.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=OutboxMessage.PENDING, next_attempt_at__lte=now)
+            .order_by("next_attempt_at", "id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        OutboxMessage.objects.filter(
+            id__in=ids, status=OutboxMessage.PENDING, next_attempt_at__lte=now
+        ).update(next_attempt_at=lease_until)
+        return list(
+            OutboxMessage.objects
+            .filter(id__in=ids, next_attempt_at=lease_until)
+            .order_by("id")
+        )
+
+
+def deliver_batch(connection, batch_size, max_attempts):
+    """
+    Sends up to batch_size due messages over an already opened connection
+    and records the outcome of each. Returns (sent, failed).
+
+    The messages are claimed first (claim_batch); sending happens outside
+    any transaction, so no rows stay locked while waiting on SMTP.
+    """
+    messages = claim_batch(batch_size)
+    sent = failed = 0
+
+    for message in messages:
+        email = EmailMessage(
+            subject=message.subject,
+            body=message.body,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[message.recipient],
+            connection=connection,
+        )
+        try:
+            email.send()
+        except Exception as exc:
+            reopen(connection)
+            message.attempts += 1
+            message.last_error = str(exc)[:1000]
+            if message.attempts >= max_attempts:
+                message.status = OutboxMessage.FAILED
+            else:
+                message.next_attempt_at = timezone.now() + retry_delay(message.attempts)
+            failed += 1
+        else:
+            message.status = OutboxMessage.SENT
+            message.sent_at = timezone.now()
+            sent += 1
+
+    OutboxMessage.objects.bulk_update(
+        messages,
+        ["status", "attempts", "next_attempt_at", "last_error", "sent_at"],
     )
+    return sent, failed
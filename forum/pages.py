@@ -0,0 +1,91 @@
+from django.conf import settings
+from django.db.models import Prefetch
+from django.http import Http404
+from django.template.loader import render_to_string
+
+from .cache import get_thread_version, single_flight
+from .models import Resource, Tag, Thread
+
+
+def render_reply(post):
+    """
+    Returns a reply as a cacheable dict: its rendered HTML (content and
+    byline, without per-user controls) and the fields those controls need.
+    `post` must have its author loaded.
+    """
+    return {
+        "id": post.id,
+        "author_id": post.author_id,
+        "is_deleted": post.is_deleted,
+        "is_hidden": post.is_hidden,
+        "like_count": post.like_count,
+        "html": render_to_string("forum/_reply.html", {"post": post}),
+    }
+
+
+def build_thread_page(thread_id):
+    thread = (
+        Thread.objects
+        .select_related("creator")
+        .defer("excerpt", "search_vector")
+        .prefetch_related(
+            Prefetch("tags", queryset=Tag.objects.only("id", "name", "slug")),
+            Prefetch(
+                "resources",
+                queryset=Resource.objects.only(
+                    "id", "title", "resource_type", "link"
+                ),
+            ),
+        )
+        .filter(id=thread_id)
+        .first()
+    )
+    if thread is None:
+        raise Http404("No Thread matches the given query.")
+
+    posts = (
+        thread.posts.all()
+        .select_related("author")
+        .only(
+            "id",
+            "thread_id",
+            "content",
+            "content_html",
+            "created_at",
+            "is_deleted",
+            "is_hidden",
+            "like_count",
+            "author__id",
+            "author__email",
+        )
+        .order_by("-created_at")
+    )
+
+    return {
+        "thread": {
+            "id": thread.id,
+            "title": thread.title,
+            "is_locked": thread.is_locked,
+            "like_count": thread.like_count,
+            "reply_count": thread.reply_count,
+        },
+        "body_html": render_to_string("forum/_thread_body.html", {"thread": thread}),
+        "replies": [render_reply(post) for post in posts],
+    }
+
+
+def thread_page(thread_id):
+    """
+    Returns the user-independent part of a thread page from the cache,
+    keyed on the thread's version, building it once on a miss.
+
+    Reply, like, lock, edit and soft-delete paths bump the version, so a
+    cached page is never served after the thread changes, provided every
+    worker shares the cache the version lives in (forum.checks).
+    """
+    key = f"forum:thread-page:{thread_id}:{get_thread_version(thread_id)}"
+    return single_flight(
+        key,
+        lambda: build_thread_page(thread_id),
+        settings.FORUM_THREAD_CACHE_TIMEOUT,
+    )
@@ -0,0 +1,218 @@
+import base64
+import datetime
+import hashlib
+import json
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+
+def _encode_value(value):
+    # Full precision: cursors must reproduce the row's exact ordering values.
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__} in a cursor")
+
+
+def encode_cursor(values, direction):
+    payload = json.dumps({"v": values, "d": direction}, default=_encode_value)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _clean_value(field, value):
+    if value is None or isinstance(value, (dict, list)):
+        raise ValidationError("Invalid cursor value")
+    value = field.to_python(value)
+    field.run_validators(value)
+    return value
+
+
+def decode_cursor(cursor, fields=None):
+    """
+    Returns (values, direction) for a cursor token, or None if it is invalid.
+
+    With `fields`, the model fields of the ordering columns, the values are
+    converted and validated by those fields, and a cursor whose values do
+    not fit them is invalid too: cursors come from the query string.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values, direction = payload["v"], payload["d"]
+    except (ValueError, TypeError, KeyError):
+        return None
+    if direction not in ("next", "prev") or not isinstance(values, list):
+        return None
+    if fields is not None:
+        if len(values) != len(fields):
+            return None
+        try:
+            values = [_clean_value(field, value) for field, value in zip(fields, values)]
+        except (ValidationError, ValueError, TypeError, OverflowError):
+            return None
+    return values, direction
+
+
+class CursorPage:
+    cursor_based = True
+
+    def __init__(self, object_list, next_cursor, previous_cursor, paginator):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.paginator = paginator
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def total(self):
+        return self.paginator.count
+
+
+class CursorPaginator:
+    """
+    Keyset paginator: pages are fetched with a WHERE on the ordering columns
+    of the last (or first) row seen, so any page costs the same as the first.
+
+    `ordering` must be unique across rows (end it with the primary key).
+    Rows may be model instances or dicts (from .values()). The total is
+    only computed on demand and cached for FORUM_PAGINATION_COUNT_TIMEOUT
+    seconds, keyed on the query and `count_version`. It counts
+    `count_queryset` when given: the queryset without per-user
+    annotations, so users share one cached count.
+    """
+
+    def __init__(self, queryset, per_page, ordering=("-created_at", "-id"), count_version=None,
+                 count_queryset=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.fields = [field.lstrip("-") for field in self.ordering]
+        self.count_version = count_version
+        self.count_queryset = count_queryset if count_queryset is not None else queryset
+
+    def _values(self, row):
+        if isinstance(row, dict):
+            return [row[field] for field in self.fields]
+        return [getattr(row, field) for field in self.fields]
+
+    def _ordering_fields(self):
+        annotations = self.queryset.query.annotations
+        return [
+            annotations[name].output_field
+            if name in annotations
+            else self.queryset.model._meta.get_field(name)
+            for name in self.fields
+        ]
+
+    def _keyset(self, values, forward):
+        """
+        Rows strictly after `values` in the ordering (or before, when not
+        forward): (a, b) after (x, y) is a past x, or a = x and b past y.
+        """
+        clauses = []
+        for position, ordering in enumerate(self.ordering):
+            descending = ordering.startswith("-")
+            lookup = "lt" if descending == forward else "gt"
+            equal = {
+                field: value
+                for field, value in zip(self.fields[:position], values[:position])
+            }
+            clauses.append(
+                Q(**equal, **{f"{self.fields[position]}__{lookup}": values[position]})
+            )
+        return reduce(or_, clauses)
+
+    def _reversed_ordering(self):
+        return [
+            field[1:] if field.startswith("-") else f"-{field}"
+            for field in self.ordering
+        ]
+
+    def _page_queryset(self, cursor):
+        """
+        Returns the queryset for the page at cursor (limited to one row more
+        than a page, to tell whether there are more) and the decoded cursor.
+        """
+        decoded = decode_cursor(cursor, self._ordering_fields()) if cursor else None
+
+        if decoded is None:
+            queryset = self.queryset.order_by(*self.ordering)
+        else:
+            values, direction = decoded
+            queryset = self.queryset.filter(self._keyset(values, direction == "next"))
+            if direction == "next":
+                queryset = queryset.order_by(*self.ordering)
+            else:
+                queryset = queryset.order_by(*self._reversed_ordering())
+        return queryset[:self.per_page + 1], decoded
+
+    def _page(self, rows, decoded):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if decoded is None:
+            has_next, has_previous = has_more, False
+        elif decoded[1] == "next":
+            has_next, has_previous = has_more, True
+        else:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = encode_cursor(self._values(rows[-1]), "next")
+        if rows and has_previous:
+            previous_cursor = encode_cursor(self._values(rows[0]), "prev")
+        return CursorPage(rows, next_cursor, previous_cursor, self)
+
+    def get_page(self, cursor=None):
+        queryset, decoded = self._page_queryset(cursor)
+        return self._page(list(queryset), decoded)
+
+    async def aget_page(self, cursor=None):
+        queryset, decoded = self._page_queryset(cursor)
+        return self._page([row async for row in queryset], decoded)
+
+    @property
+    def count(self):
+        query = str(self.count_queryset.query).encode()
+        key = "forum:count:{}:{}".format(
+            self.count_version, hashlib.sha1(query).hexdigest()
+        )
+        return cache.get_or_set(
+            key, self.count_queryset.count, settings.FORUM_PAGINATION_COUNT_TIMEOUT
+        )
+
+
+class AsyncPaginator(Paginator):
+    """
+    Page-number paginator over a queryset for async views: the count and
+    the page's rows are fetched with the async ORM.
+    """
+
+    async def aget_page(self, number):
+        self.count = await self.object_list.acount()
+        page = self.get_page(number)
+        page.object_list = [row async for row in page.object_list]
+        return page
@@ -0,0 +1,309 @@
+"""
+On-demand profiling of single requests and capture of slow ones, stored
+as RequestCapture rows and browsed in the admin.
+
+Trusted users profile a request by adding ?_profile=1 (or the
+X-Forum-Profile: 1 header): sync requests run under cProfile, async ones
+are stack-sampled. Requests slower than FORUM_SLOW_REQUEST_MS are
+captured with their normalized SQL, duplicate-query fingerprints and
+stacks sampled by a watchdog while they were running late.
+"""
+import cProfile
+import hashlib
+import io
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils.decorators import sync_and_async_middleware
+
+from .instrumentation import current_timings, untimed, view_name
+from .models import RequestCapture
+from .utils import is_trusted_user
+
+logger = logging.getLogger(__name__)
+
+PROFILE_PARAM = "_profile"
+PROFILE_HEADER = "X-Forum-Profile"
+
+# Lines of pstats output and distinct stacks kept per capture.
+PROFILE_LINES = 80
+STACK_LIMIT = 50
+
+
+def normalize_sql(sql):
+    """
+    Replaces literals and placeholder lists, so the same statement with
+    different values (or IN list lengths) normalizes alike.
+    """
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\b\d+(?:\.\d+)?\b", "?", sql)
+    sql = sql.replace("%s", "?")
+    sql = re.sub(r"\(\s*\?(?:\s*,\s*\?)+\s*\)", "(...)", sql)
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.blake2b(normalized.encode(), digest_size=6).hexdigest()
+
+
+def summarize_queries(statements):
+    """
+    Groups [(sql, seconds)] by normalized statement. Returns all groups,
+    slowest first, and the ones run more than once (N+1 suspects), most
+    repeated first.
+    """
+    groups = {}
+    for sql, seconds in statements:
+        normalized = normalize_sql(sql)
+        key = fingerprint(normalized)
+        group = groups.setdefault(key, {"fingerprint": key, "sql": normalized, "count": 0, "ms": 0.0})
+        group["count"] += 1
+        group["ms"] += seconds * 1000
+    for group in groups.values():
+        group["ms"] = round(group["ms"], 3)
+    queries = sorted(groups.values(), key=lambda group: group["ms"], reverse=True)
+    duplicates = sorted(
+        (group for group in queries if group["count"] > 1),
+        key=lambda group: group["count"],
+        reverse=True,
+    )
+    return queries, duplicates
+
+
+def collapse(frame):
+    """
+    A stack as "file:function;file:function;...", outermost first.
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def sample_stacks(thread_ids, counts, frames=None):
+    frames = frames if frames is not None else sys._current_frames()
+    for thread_id in list(thread_ids):
+        frame = frames.get(thread_id)
+        if frame is not None:
+            counts[collapse(frame)] += 1
+
+
+def format_stacks(counts):
+    return "\n".join(f"{count} {stack}" for stack, count in counts.most_common(STACK_LIMIT))
+
+
+class StackSampler:
+    """
+    Samples the stacks of a request's threads every interval seconds in a
+    background thread. Threads shared with other requests (the event loop,
+    pool threads) show their work too.
+    """
+
+    def __init__(self, thread_ids, interval):
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="forum-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            sample_stacks(self.thread_ids, self.counts)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+class Watchdog:
+    """
+    Samples the stacks of in-flight requests once they are slower than
+    FORUM_SLOW_REQUEST_MS, so slow captures show what they were doing.
+    One per process, started with the first tracked request.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self._started = False
+        self._lock = threading.Lock()
+
+    def track(self, started, timings):
+        if not self._started:
+            with self._lock:
+                if not self._started:
+                    threading.Thread(target=self._run, name="forum-watchdog", daemon=True).start()
+                    self._started = True
+        key = object()
+        self._inflight[key] = (started, timings, Counter())
+        return key
+
+    def untrack(self, key):
+        return self._inflight.pop(key)[2]
+
+    def _run(self):
+        while True:
+            time.sleep(settings.FORUM_SLOW_SAMPLE_INTERVAL / 1000)
+            threshold = settings.FORUM_SLOW_REQUEST_MS / 1000
+            now = time.perf_counter()
+            frames = None
+            for started, timings, counts in list(self._inflight.values()):
+                if now - started >= threshold:
+                    frames = frames if frames is not None else sys._current_frames()
+                    sample_stacks(timings.threads, counts, frames)
+
+
+watchdog = Watchdog()
+
+
+def profile_requested(request):
+    return request.GET.get(PROFILE_PARAM) == "1" or request.headers.get(PROFILE_HEADER) == "1"
+
+
+def format_profile(profiler):
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(PROFILE_LINES)
+    return output.getvalue()
+
+
+def save_capture(kind, request, response, user, duration, timings, stacks="", profile=""):
+    """
+    Stores a RequestCapture and drops the ones beyond FORUM_CAPTURE_LIMIT.
+    Failures are logged, never raised into the response.
+    """
+    queries, duplicates = summarize_queries(timings.statements or [])
+    try:
+        capture = RequestCapture.objects.create(
+            kind=kind,
+            view_name=view_name(request)[:200],
+            method=request.method[:10],
+            path=request.get_full_path()[:500],
+            status_code=response.status_code,
+            user=user if user is not None and user.is_authenticated else None,
+            duration_ms=round(duration * 1000, 3),
+            query_count=timings.queries,
+            sql_ms=round(timings.seconds["sql"] * 1000, 3),
+            queries=queries,
+            duplicate_queries=duplicates,
+            stacks=stacks,
+            profile=profile,
+        )
+        RequestCapture.objects.filter(id__lte=capture.id - settings.FORUM_CAPTURE_LIMIT).delete()
+        return capture
+    except DatabaseError:
+        logger.exception("Could not store the capture of %s", request.path)
+        return None
+
+
+def capture_after(kind, request, response, user, duration, timings, stacks="", profile=""):
+    capture = save_capture(kind, request, response, user, duration, timings, stacks, profile)
+    if capture is not None and kind == RequestCapture.PROFILE:
+        response[PROFILE_HEADER] = str(capture.id)
+
+
+@sync_and_async_middleware
+def capture_middleware(get_response):
+    """
+    Goes after AuthenticationMiddleware and needs instrumentation_middleware
+    before it (for the request's timings).
+    """
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            timings = current_timings()
+            if timings is None:
+                return await get_response(request)
+            user = None
+            profile = profile_requested(request)
+            if profile:
+                user = await request.auser()
+                profile = user.is_authenticated and await sync_to_async(is_trusted_user)(user)
+            slow_ms = settings.FORUM_SLOW_REQUEST_MS
+            if not profile and not slow_ms:
+                return await get_response(request)
+
+            timings.statements = []
+            started = time.perf_counter()
+            if profile:
+                with StackSampler(timings.threads, settings.FORUM_PROFILE_SAMPLE_INTERVAL / 1000) as sampler:
+                    response = await get_response(request)
+                duration = time.perf_counter() - started
+                with untimed():
+                    await sync_to_async(capture_after)(
+                        RequestCapture.PROFILE, request, response, user, duration, timings,
+                        stacks=format_stacks(sampler.counts),
+                    )
+                return response
+
+            key = watchdog.track(started, timings)
+            try:
+                response = await get_response(request)
+            finally:
+                samples = watchdog.untrack(key)
+            duration = time.perf_counter() - started
+            if duration * 1000 >= slow_ms:
+                user = await request.auser()
+                with untimed():
+                    await sync_to_async(capture_after)(
+                        RequestCapture.SLOW, request, response, user, duration, timings,
+                        stacks=format_stacks(samples),
+                    )
+            return response
+
+    else:
+
+        def middleware(request):
+            timings = current_timings()
+            if timings is None:
+                return get_response(request)
+            profile = profile_requested(request) and is_trusted_user(request.user)
+            slow_ms = settings.FORUM_SLOW_REQUEST_MS
+            if not profile and not slow_ms:
+                return get_response(request)
+
+            timings.statements = []
+            started = time.perf_counter()
+            if profile:
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    response = get_response(request)
+                finally:
+                    profiler.disable()
+                duration = time.perf_counter() - started
+                with untimed():
+                    capture_after(
+                        RequestCapture.PROFILE, request, response, request.user, duration, timings,
+                        profile=format_profile(profiler),
+                    )
+                return response
+
+            key = watchdog.track(started, timings)
+            try:
+                response = get_response(request)
+            finally:
+                samples = watchdog.untrack(key)
+            duration = time.perf_counter() - started
+            if duration * 1000 >= slow_ms:
+                with untimed():
+                    capture_after(
+                        RequestCapture.SLOW, request, response, request.user, duration, timings,
+                        stacks=format_stacks(samples),
+                    )
+            return response
+
+    return middleware
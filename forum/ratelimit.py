@@ -0,0 +1,174 @@
+import fcntl
+import hashlib
+import os
+import random
+import time
+from functools import lru_cache, wraps
+
+from django.conf import settings
+from django.db import connection
+from django.shortcuts import render
+from django.utils.module_loading import import_string
+
+PERIODS = {
+    "s": (1, "second"),
+    "m": (60, "minute"),
+    "h": (3600, "hour"),
+    "d": (86400, "day"),
+}
+
+
+def parse_rate(rate):
+    """
+    "10/m" -> (10, 60). The period may carry a multiplier, as in "5/15m".
+    """
+    limit, period = rate.split("/")
+    count, unit = period[:-1] or "1", period[-1]
+    return int(limit), int(count) * PERIODS[unit][0]
+
+
+def describe_period(seconds):
+    for unit_seconds, name in sorted(PERIODS.values(), reverse=True):
+        if seconds % unit_seconds == 0:
+            count = seconds // unit_seconds
+            return f"{count} {name}" + ("s" if count != 1 else "")
+
+
+class DatabaseStore:
+    """
+    Keeps counters in the RateLimitCounter table. Each hit is one atomic
+    INSERT ... ON CONFLICT DO UPDATE, so any number of workers and hosts
+    share the same counts, and one lookup of the previous window.
+    """
+
+    def hit(self, key, window_start, period):
+        from .models import RateLimitCounter
+
+        table = connection.ops.quote_name(RateLimitCounter._meta.db_table)
+        key_column = connection.ops.quote_name("key")
+        window_column = connection.ops.quote_name("window_start")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({key_column}, {window_column}, hits) "
+                f"VALUES (%s, %s, 1) "
+                f"ON CONFLICT ({key_column}, {window_column}) "
+                f"DO UPDATE SET hits = {table}.hits + 1 "
+                f"RETURNING hits",
+                [key, window_start],
+            )
+            current = cursor.fetchone()[0]
+
+        previous = (
+            RateLimitCounter.objects
+            .filter(key=key, window_start=window_start - period)
+            .values_list("hits", flat=True)
+            .first()
+        ) or 0
+        return current, previous
+
+    def purge(self, before):
+        from .models import RateLimitCounter
+
+        RateLimitCounter.objects.filter(window_start__lt=before).delete()
+
+
+class FileStore:
+    """
+    Keeps each key's counters in a small file under FORUM_RATELIMIT_DIR,
+    updated under an exclusive flock. Shared by all workers on one host
+    without a database round-trip.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or settings.FORUM_RATELIMIT_DIR
+        os.makedirs(self.directory, exist_ok=True)
+
+    def hit(self, key, window_start, period):
+        name = hashlib.sha1(key.encode()).hexdigest()
+        with open(os.path.join(self.directory, name), "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            fields = f.read().split()
+            if len(fields) == 3:
+                stored_window, current, previous = map(int, fields)
+            else:
+                stored_window, current, previous = window_start, 0, 0
+
+            if stored_window != window_start:
+                previous = current if stored_window == window_start - period else 0
+                current = 0
+            current += 1
+
+            f.seek(0)
+            f.truncate()
+            f.write(f"{window_start} {current} {previous}")
+        return current, previous
+
+    def purge(self, before):
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime < before:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+@lru_cache(maxsize=None)
+def get_store():
+    return import_string(settings.FORUM_RATELIMIT_STORE)()
+
+
+def is_limited(key, rate):
+    """
+    Records a hit for key and tells whether it exceeds rate over a sliding
+    window, estimated from the current and previous fixed windows. Returns
+    (limited, seconds until the current window ends).
+    """
+    limit, period = parse_rate(rate)
+    now = time.time()
+    window_start = int(now // period) * period
+    store = get_store()
+    current, previous = store.hit(key, window_start, period)
+    # Counters of keys that are no longer hit would otherwise stay forever.
+    if random.random() < settings.FORUM_RATELIMIT_PURGE_RATE:
+        store.purge(now - settings.FORUM_RATELIMIT_RETENTION)
+    elapsed = (now - window_start) / period
+    estimated = previous * (1 - elapsed) + current
+    return estimated > limit, int(window_start + period - now) + 1
+
+
+def client_key(request):
+    if request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def rate_limit(rate, action, methods=("POST",), key=client_key, skip_if=None):
+    """
+    Limits a view to `rate` requests per client, shared across workers.
+    Over the limit the view is not called and forum/rate_limited.html is
+    returned with status 429. `skip_if(user)` exempts users.
+    """
+    retry_after = describe_period(parse_rate(rate)[1])
+
+    def decorator(view):
+        group = f"{view.__module__}.{view.__qualname__}"
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method in methods and not (skip_if and skip_if(request.user)):
+                limited, seconds = is_limited(f"{group}:{key(request)}", rate)
+                if limited:
+                    response = render(
+                        request,
+                        "forum/rate_limited.html",
+                        {"action": action, "retry_after": retry_after},
+                        status=429,
+                    )
+                    response["Retry-After"] = str(seconds)
+                    return response
+            return view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,71 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import markdown
+from django.conf import settings
+
+from .instrumentation import timed
+
+EXTENSIONS = ("fenced_code", "tables")
+
+_local = threading.local()
+
+
+def _get_renderer(extensions):
+    # Markdown instances are reusable after reset() but not thread-safe,
+    # so each thread keeps its own per extension set.
+    renderers = getattr(_local, "renderers", None)
+    if renderers is None:
+        renderers = _local.renderers = {}
+    renderer = renderers.get(extensions)
+    if renderer is None:
+        renderer = renderers[extensions] = markdown.Markdown(extensions=list(extensions))
+    return renderer
+
+
+@timed("markdown")
+def render_markdown(text, extensions=EXTENSIONS):
+    return _get_renderer(tuple(extensions)).reset().convert(text)
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_html_cache = LRUCache(settings.FORUM_MARKDOWN_CACHE_SIZE)
+
+
+def cached_markdown(text, extensions=EXTENSIONS):
+    """
+    Renders markdown through a bounded per-process LRU cache keyed by the
+    content hash and extension set.
+    """
+    extensions = tuple(extensions)
+    key = (hashlib.blake2b(text.encode(), digest_size=16).digest(), extensions)
+    html = _html_cache.get(key)
+    if html is None:
+        html = render_markdown(text, extensions)
+        _html_cache.set(key, html)
+    return html
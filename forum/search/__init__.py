@@ -0,0 +1,163 @@
+import hashlib
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from forum.cache import THREAD_CORPUS, THREAD_TEXT, bump_version, get_version, single_flight
+
+from .index import InvertedIndex
+from .results import ExtendedResults
+from .tags import tag_thread_ids
+
+DEFAULT_BACKENDS = {
+    "postgresql": "forum.search.backends.PostgresSearchBackend",
+    "sqlite": "forum.search.backends.SQLiteSearchBackend",
+}
+FALLBACK_BACKEND = "forum.search.backends.IndexSearchBackend"
+
+thread_index = InvertedIndex()
+_build_lock = threading.Lock()
+# THREAD_TEXT version the index is up to date with.
+_index_version = None
+
+
+def _change_key(version):
+    return f"forum:search:change:{version}"
+
+
+def _rebuild(version):
+    from forum.models import Thread
+
+    rows = Thread.objects.values_list("id", "title", "content").iterator(chunk_size=2000)
+    thread_index.build(rows)
+    return version
+
+
+def _apply_changes(version):
+    """
+    Re-reads the threads changed since the index's version from the change
+    log and returns the version the index is now at, or None when the log
+    has a gap (expired or evicted entries, or more changes than it keeps).
+    Entries missing only at the end are still being written; they are
+    picked up on a later call.
+    """
+    from forum.models import Thread
+
+    versions = range(_index_version + 1, version + 1)
+    if len(versions) > settings.FORUM_SEARCH_CHANGE_LOG_SIZE:
+        return None
+    changes = cache.get_many([_change_key(v) for v in versions])
+    thread_ids = set()
+    reached = _index_version
+    for v in versions:
+        thread_id = changes.get(_change_key(v))
+        if thread_id is None:
+            break
+        thread_ids.add(thread_id)
+        reached = v
+    if len(changes) > reached - _index_version:
+        # entries after a missing one: the missing one is gone for good
+        return None
+
+    rows = Thread.objects.filter(id__in=thread_ids).values_list("id", "title", "content")
+    for thread_id, title, content in rows:
+        thread_index.add(thread_id, title, content)
+        thread_ids.discard(thread_id)
+    for thread_id in thread_ids:
+        thread_index.remove(thread_id)
+    return reached
+
+
+def ensure_index():
+    """
+    Builds the index from the database on first use in this process. Once
+    threads have changed (the THREAD_TEXT version moved on), only the
+    changed threads are re-read, from the change log; the index is rebuilt
+    only when the log has a gap.
+    """
+    global _index_version
+    version = get_version(THREAD_TEXT)
+    if not thread_index.is_built or version != _index_version:
+        with _build_lock:
+            if not thread_index.is_built or _index_version is None or version < _index_version:
+                _index_version = _rebuild(version)
+            elif version != _index_version:
+                reached = _apply_changes(version)
+                _index_version = _rebuild(version) if reached is None else reached
+    return thread_index
+
+
+def _announce_change(thread_id):
+    """
+    Records a changed thread under a new THREAD_TEXT version, which every
+    process (this one included) applies on its next search.
+    """
+    version = bump_version(THREAD_TEXT)
+    cache.set(_change_key(version), thread_id, settings.FORUM_SEARCH_CHANGE_LOG_TIMEOUT)
+
+
+def index_thread(thread):
+    _announce_change(thread.id)
+
+
+def unindex_thread(thread_id):
+    _announce_change(thread_id)
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    """
+    Returns the configured search backend, or the native full-text backend
+    for the current database when FORUM_SEARCH_BACKEND is empty.
+    """
+    path = settings.FORUM_SEARCH_BACKEND
+    if not path:
+        path = DEFAULT_BACKENDS.get(connection.vendor, FALLBACK_BACKEND)
+        if connection.vendor == "sqlite":
+            from .fts import sqlite_fts5_available
+
+            if not sqlite_fts5_available(connection):
+                path = FALLBACK_BACKEND
+    return import_string(path)()
+
+
+def find_threads(query):
+    """
+    Returns ranked thread ids for the query as a lazily evaluated result
+    supporting count() and slicing, so it can be handed to a Paginator.
+    Threads matched only through their tags follow the backend's results.
+    """
+    return ExtendedResults(get_backend().search(query), tag_thread_ids(query))
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+def invalidate_search_cache():
+    bump_version(THREAD_CORPUS)
+
+
+def find_thread_ids(query):
+    """
+    Returns the ranked thread ids for the query (at most
+    FORUM_SEARCH_MAX_RESULTS) from the cache, computing them once on a miss.
+
+    Entries are keyed on the thread corpus version, which Thread and Tag
+    changes bump. The version lives in the default cache, so this holds
+    across workers only when they share it (forum.checks); a worker on its
+    own per-process cache serves results for up to
+    FORUM_SEARCH_CACHE_TIMEOUT after another worker changed the data.
+    """
+    query = normalize_query(query)
+    digest = hashlib.sha1(query.encode()).hexdigest()
+    key = f"forum:search:{get_version(THREAD_CORPUS)}:{digest}"
+    return single_flight(
+        key,
+        lambda: find_threads(query)[:settings.FORUM_SEARCH_MAX_RESULTS],
+        settings.FORUM_SEARCH_CACHE_TIMEOUT,
+    )
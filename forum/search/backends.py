@@ -0,0 +1,99 @@
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, Q
+
+from forum.models import Thread
+
+from . import ensure_index
+from .fts import SEARCH_CONFIG, SQLITE_TABLE
+from .index import tokenize
+from .results import FTSResults, IdListResults, QueryResults
+from .scoring import rank_candidates
+
+
+class IndexSearchBackend:
+    """
+    Ranks threads with the in-process inverted index.
+    """
+
+    def search(self, query):
+        ids = ensure_index().search(query, limit=settings.FORUM_SEARCH_MAX_RESULTS)
+        return IdListResults(ids)
+
+
+class FuzzySearchBackend:
+    """
+    Portable backend: finds candidates with icontains and ranks them by
+    rapidfuzz similarity against the title and the stored excerpt.
+    """
+
+    def search(self, query):
+        tokens = query.lower().split()
+        if not tokens:
+            return IdListResults([])
+
+        q_filter = Q()
+        for token in tokens:
+            q_filter |= Q(title__icontains=token)
+            q_filter |= Q(content__icontains=token)
+
+        rows = list(
+            Thread.objects.filter(q_filter).values_list("id", "title", "excerpt")
+        )
+        if not rows:
+            return IdListResults([])
+
+        ids, titles, excerpts = zip(*rows)
+        return IdListResults(
+            rank_candidates(
+                query, ids, titles, excerpts, settings.FORUM_SEARCH_MAX_RESULTS
+            )
+        )
+
+
+class PostgresSearchBackend:
+    """
+    Ranks threads with the weighted search_vector column and its GIN index.
+    Counting, ranking and pagination all run in PostgreSQL.
+    """
+
+    def search(self, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return IdListResults([])
+
+        search_query = reduce(
+            or_,
+            (
+                SearchQuery(f"{token}:*", config=SEARCH_CONFIG, search_type="raw")
+                for token in tokens
+            ),
+        )
+        queryset = (
+            Thread.objects
+            .filter(search_vector=search_query)
+            .annotate(rank=SearchRank(F("search_vector"), search_query))
+            .order_by("-rank", "-created_at")
+            .values_list("id", flat=True)
+        )
+        return QueryResults(queryset)
+
+
+class SQLiteSearchBackend:
+    """
+    Ranks threads with the FTS5 table, title matches weighted over content.
+    Counting, ranking and pagination all run in SQLite.
+    """
+
+    WEIGHTS = (3.0, 1.0)
+
+    def search(self, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return IdListResults([])
+
+        match = " OR ".join(f'"{token}"*' for token in dict.fromkeys(tokens))
+        return FTSResults(SQLITE_TABLE, match, self.WEIGHTS)
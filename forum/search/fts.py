@@ -0,0 +1,135 @@
+"""
+Database-side full-text search structures for forum_thread.
+
+PostgreSQL keeps a weighted tsvector in forum_thread.search_vector
+(title weight A, content weight B) maintained by a trigger and covered by
+a GIN index. SQLite keeps an external-content FTS5 table kept in sync by
+triggers on forum_thread.
+"""
+
+SEARCH_CONFIG = "english"
+
+SQLITE_TABLE = "forum_thread_fts"
+
+POSTGRES_CREATE = [
+    f"""
+    CREATE OR REPLACE FUNCTION forum_thread_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(NEW.content, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    DROP TRIGGER IF EXISTS forum_thread_search_vector_trigger ON forum_thread
+    """,
+    """
+    CREATE TRIGGER forum_thread_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, content ON forum_thread
+    FOR EACH ROW EXECUTE FUNCTION forum_thread_search_vector_update()
+    """,
+    """
+    UPDATE forum_thread SET title = title
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS forum_thread_search_vector_gin
+    ON forum_thread USING GIN (search_vector)
+    """,
+]
+
+POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS forum_thread_search_vector_gin",
+    "DROP TRIGGER IF EXISTS forum_thread_search_vector_trigger ON forum_thread",
+    "DROP FUNCTION IF EXISTS forum_thread_search_vector_update()",
+]
+
+SQLITE_CREATE_TABLE = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} USING fts5(
+        title, content,
+        content='forum_thread', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+"""
+
+SQLITE_TRIGGERS = {
+    "forum_thread_fts_insert": f"""
+        CREATE TRIGGER forum_thread_fts_insert AFTER INSERT ON forum_thread BEGIN
+            INSERT INTO {SQLITE_TABLE}(rowid, title, content)
+            VALUES (new.id, new.title, new.content);
+        END
+    """,
+    "forum_thread_fts_delete": f"""
+        CREATE TRIGGER forum_thread_fts_delete AFTER DELETE ON forum_thread BEGIN
+            INSERT INTO {SQLITE_TABLE}({SQLITE_TABLE}, rowid, title, content)
+            VALUES ('delete', old.id, old.title, old.content);
+        END
+    """,
+    "forum_thread_fts_update": f"""
+        CREATE TRIGGER forum_thread_fts_update AFTER UPDATE OF title, content ON forum_thread BEGIN
+            INSERT INTO {SQLITE_TABLE}({SQLITE_TABLE}, rowid, title, content)
+            VALUES ('delete', old.id, old.title, old.content);
+            INSERT INTO {SQLITE_TABLE}(rowid, title, content)
+            VALUES (new.id, new.title, new.content);
+        END
+    """,
+}
+
+
+def sqlite_fts5_available(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        options = {row[0] for row in cursor.fetchall()}
+    return "ENABLE_FTS5" in options
+
+
+def install(connection):
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            for sql in POSTGRES_CREATE:
+                cursor.execute(sql)
+    elif connection.vendor == "sqlite":
+        ensure_sqlite_fts(connection)
+
+
+def uninstall(connection):
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            for sql in POSTGRES_DROP:
+                cursor.execute(sql)
+    elif connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            for name in SQLITE_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(f"DROP TABLE IF EXISTS {SQLITE_TABLE}")
+
+
+def ensure_sqlite_fts(connection, create=True):
+    """
+    Creates the FTS5 table and its triggers if missing, rebuilding the
+    table contents when any trigger had to be (re)created.
+
+    SQLite drops triggers along with their table, and Django's SQLite
+    schema editor rebuilds forum_thread for many field changes, so this
+    also runs after every migrate with create=False, which only repairs
+    triggers of an already installed table.
+    """
+    if not sqlite_fts5_available(connection):
+        return
+    with connection.cursor() as cursor:
+        if create:
+            cursor.execute(SQLITE_CREATE_TABLE)
+        elif SQLITE_TABLE not in connection.introspection.table_names(cursor):
+            return
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'forum_thread'"
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = [name for name in SQLITE_TRIGGERS if name not in existing]
+        for name in missing:
+            cursor.execute(SQLITE_TRIGGERS[name])
+        if missing:
+            cursor.execute(
+                f"INSERT INTO {SQLITE_TABLE}({SQLITE_TABLE}) VALUES ('rebuild')"
+            )
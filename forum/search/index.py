@@ -0,0 +1,164 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+
+TOKEN_REGEX = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return TOKEN_REGEX.findall(text.lower())
+
+
+def trigrams(term):
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class InvertedIndex:
+    """
+    In-memory inverted index over thread titles and contents.
+
+    Postings map each term to {thread_id: weighted term frequency}, where a
+    title occurrence counts TITLE_WEIGHT times. Documents are scored with
+    BM25 over the weighted frequencies, so a search only touches the posting
+    lists of the query terms (and their trigram neighbours for typos).
+    """
+
+    TITLE_WEIGHT = 3
+    K1 = 1.2
+    B = 0.75
+    TYPO_SIMILARITY = 0.4
+    TYPO_EXPANSIONS = 5
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._postings = defaultdict(dict)
+        self._doc_terms = {}
+        self._doc_lengths = {}
+        self._total_length = 0
+        self._trigrams = defaultdict(set)
+
+    @property
+    def is_built(self):
+        return self._built
+
+    def __len__(self):
+        return len(self._doc_lengths)
+
+    def build(self, rows):
+        """
+        Replace the index contents with (id, title, content) rows.
+        """
+        with self._lock:
+            self._postings = defaultdict(dict)
+            self._doc_terms = {}
+            self._doc_lengths = {}
+            self._total_length = 0
+            self._trigrams = defaultdict(set)
+            for thread_id, title, content in rows:
+                self._add(thread_id, title, content)
+            self._built = True
+
+    def add(self, thread_id, title, content):
+        with self._lock:
+            self._remove(thread_id)
+            self._add(thread_id, title, content)
+
+    def remove(self, thread_id):
+        with self._lock:
+            self._remove(thread_id)
+
+    def _add(self, thread_id, title, content):
+        frequencies = Counter()
+        for term in tokenize(title):
+            frequencies[term] += self.TITLE_WEIGHT
+        for term in tokenize(content):
+            frequencies[term] += 1
+
+        for term, frequency in frequencies.items():
+            postings = self._postings[term]
+            if not postings:
+                for gram in trigrams(term):
+                    self._trigrams[gram].add(term)
+            postings[thread_id] = frequency
+
+        length = sum(frequencies.values())
+        self._doc_terms[thread_id] = tuple(frequencies)
+        self._doc_lengths[thread_id] = length
+        self._total_length += length
+
+    def _remove(self, thread_id):
+        terms = self._doc_terms.pop(thread_id, None)
+        if terms is None:
+            return
+
+        self._total_length -= self._doc_lengths.pop(thread_id)
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(thread_id, None)
+            if not postings:
+                del self._postings[term]
+                for gram in trigrams(term):
+                    self._trigrams[gram].discard(term)
+
+    def _expand(self, term):
+        """
+        Returns [(term, weight)] for the query term and the closest indexed
+        terms by trigram Jaccard similarity, to tolerate typos and plurals.
+        """
+        expansions = {}
+        if term in self._postings:
+            expansions[term] = 1.0
+
+        grams = trigrams(term)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._trigrams.get(gram, ()))
+
+        similar = []
+        for candidate, overlap in shared.items():
+            if candidate == term:
+                continue
+            similarity = overlap / (len(grams) + len(trigrams(candidate)) - overlap)
+            if similarity >= self.TYPO_SIMILARITY:
+                similar.append((similarity, candidate))
+
+        for similarity, candidate in heapq.nlargest(self.TYPO_EXPANSIONS, similar):
+            expansions[candidate] = similarity
+
+        return expansions.items()
+
+    def search(self, query, limit=None):
+        """
+        Returns thread ids matching the query, best BM25 score first.
+        """
+        with self._lock:
+            doc_count = len(self._doc_lengths)
+            if not doc_count:
+                return []
+            average_length = self._total_length / doc_count
+
+            scores = defaultdict(float)
+            for term in set(tokenize(query)):
+                for indexed_term, weight in self._expand(term):
+                    postings = self._postings[indexed_term]
+                    df = len(postings)
+                    idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                    for thread_id, frequency in postings.items():
+                        norm = self.K1 * (
+                            1 - self.B
+                            + self.B * self._doc_lengths[thread_id] / average_length
+                        )
+                        scores[thread_id] += (
+                            weight * idf * frequency * (self.K1 + 1) / (frequency + norm)
+                        )
+
+        if limit is None:
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        else:
+            ranked = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [thread_id for thread_id, score in ranked]
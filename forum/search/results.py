@@ -0,0 +1,128 @@
+from django.db import connection
+
+
+class IdListResults:
+    """
+    Ranked thread ids already held in memory.
+    """
+
+    def __init__(self, ids):
+        self.ids = list(ids)
+
+    def count(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        return self.ids[index]
+
+    def restrict(self, ids):
+        return set(self.ids).intersection(ids)
+
+
+class QueryResults:
+    """
+    Ranked thread ids from an ordered ``values_list("id", flat=True)``
+    queryset, so counting and slicing run as SQL.
+    """
+
+    def __init__(self, queryset):
+        self.queryset = queryset
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self.queryset.count()
+        return self._count
+
+    def __getitem__(self, index):
+        return list(self.queryset[index])
+
+    def restrict(self, ids):
+        return set(self.queryset.filter(id__in=ids))
+
+
+class FTSResults:
+    """
+    Ranked thread ids from the SQLite FTS5 table, ordered by bm25().
+    """
+
+    def __init__(self, table, match, weights):
+        self.table = table
+        self.match = match
+        self.weights = weights
+        self._count = None
+
+    def _execute(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def count(self):
+        if self._count is None:
+            rows = self._execute(
+                f"SELECT COUNT(*) FROM {self.table} WHERE {self.table} MATCH %s",
+                [self.match],
+            )
+            self._count = rows[0][0]
+        return self._count
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        stop = self.count() if index.stop is None else index.stop
+        if stop <= start:
+            return []
+        weights = ", ".join(str(weight) for weight in self.weights)
+        rows = self._execute(
+            f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s "
+            f"ORDER BY bm25({self.table}, {weights}), rowid DESC "
+            f"LIMIT %s OFFSET %s",
+            [self.match, stop - start, start],
+        )
+        return [row[0] for row in rows]
+
+    def restrict(self, ids):
+        ids = list(ids)
+        if not ids:
+            return set()
+        placeholders = ", ".join(["%s"] * len(ids))
+        rows = self._execute(
+            f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s "
+            f"AND rowid IN ({placeholders})",
+            [self.match, *ids],
+        )
+        return {row[0] for row in rows}
+
+
+class ExtendedResults:
+    """
+    Appends extra ids (e.g. tag matches) after the primary results,
+    skipping ids the primary results already contain.
+    """
+
+    def __init__(self, primary, extra_ids):
+        self.primary = primary
+        extra_ids = list(dict.fromkeys(extra_ids))
+        present = primary.restrict(extra_ids) if extra_ids else set()
+        self.extra = [thread_id for thread_id in extra_ids if thread_id not in present]
+
+    def count(self):
+        return self.primary.count() + len(self.extra)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        total = self.primary.count()
+        start = index.start or 0
+        stop = self.count() if index.stop is None else index.stop
+
+        ids = []
+        if start < total:
+            ids.extend(self.primary[start:min(stop, total)])
+        if stop > total:
+            ids.extend(self.extra[max(start - total, 0):stop - total])
+        return ids
+
+    def restrict(self, ids):
+        return self.primary.restrict(ids) | set(self.extra).intersection(ids)
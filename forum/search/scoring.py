@@ -0,0 +1,31 @@
+import numpy as np
+from rapidfuzz import fuzz, process
+
+
+def rank_candidates(query, ids, titles, excerpts, limit, title_boost=1.3, min_score=60):
+    """
+    Scores every candidate's title and excerpt against the query in a single
+    cdist call and returns the ids of the best `limit` candidates scoring at
+    least `min_score`, best first. A candidate's score is the larger of its
+    boosted title score and its excerpt score.
+    """
+    count = len(ids)
+    if not count or limit <= 0:
+        return []
+
+    matrix = process.cdist(
+        [query],
+        list(titles) + list(excerpts),
+        scorer=fuzz.token_set_ratio,
+        dtype=np.float32,
+        workers=-1,
+    )[0]
+    scores = np.maximum(matrix[:count] * title_boost, matrix[count:])
+
+    keep = np.flatnonzero(scores >= min_score)
+    if len(keep) > limit:
+        keep = keep[np.argpartition(-scores[keep], limit - 1)[:limit]]
+    keep = keep[np.argsort(-scores[keep], kind="stable")]
+
+    ids = np.asarray(ids)
+    return ids[keep].tolist()
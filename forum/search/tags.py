@@ -0,0 +1,80 @@
+import threading
+
+from django.conf import settings
+from rapidfuzz import fuzz, process
+
+from forum.cache import TAG_NAMES, bump_version, get_version
+
+
+class TagMatcher:
+    """
+    Fuzzy matcher over all tag names, loaded once per process. The names
+    are reloaded on next use after invalidate() (called when a Tag is saved
+    or deleted) and whenever another process has bumped the TAG_NAMES
+    version.
+    """
+
+    MIN_SCORE = 70
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tags = None
+        self._version = None
+
+    def invalidate(self):
+        self._tags = None
+        bump_version(TAG_NAMES)
+
+    def _load(self):
+        version = get_version(TAG_NAMES)
+        tags = self._tags
+        if tags is None or version != self._version:
+            from forum.models import Tag
+
+            with self._lock:
+                tags = self._tags
+                if tags is None or version != self._version:
+                    rows = list(Tag.objects.values_list("id", "name"))
+                    tags = self._tags = (
+                        [tag_id for tag_id, name in rows],
+                        [name for tag_id, name in rows],
+                    )
+                    self._version = version
+        return tags
+
+    def match(self, query):
+        """
+        Returns ids of tags whose name matches the query.
+        """
+        ids, names = self._load()
+        matches = process.extract(
+            query,
+            names,
+            scorer=fuzz.token_set_ratio,
+            score_cutoff=self.MIN_SCORE,
+            limit=None,
+        )
+        return [ids[index] for name, score, index in matches]
+
+
+tag_matcher = TagMatcher()
+
+
+def tag_thread_ids(query):
+    """
+    Returns ids of the newest FORUM_SEARCH_MAX_RESULTS threads carrying a
+    tag that matches the query, resolved with a single query on the
+    thread-tag join table.
+    """
+    from forum.models import Thread
+
+    tag_ids = tag_matcher.match(query)
+    if not tag_ids:
+        return []
+    return list(
+        Thread.tags.through.objects
+        .filter(tag_id__in=tag_ids)
+        .order_by("-thread_id")
+        .values_list("thread_id", flat=True)
+        .distinct()[:settings.FORUM_SEARCH_MAX_RESULTS]
+    )
@@ -0,0 +1,216 @@
+"""
+Synthetic forum data for benchmarks and load tests. Rows are written with
+bulk_create, so signals do not run; counters, subscriptions and rendered
+HTML are filled in here instead.
+"""
+import random
+from datetime import timedelta
+
+from allauth.account.models import EmailAddress
+from allauth.socialaccount.models import SocialApp
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
+from django.db import transaction
+from django.utils import timezone
+
+from .likes import rebuild_counters
+from .models import Category, Post, Report, Tag, Thread, ThreadSubscription
+from .rendering import render_markdown
+
+SEED_PASSWORD = "forum-seed-password"
+
+WORDS = (
+    "exam midsem endsem quiz tutorial lab assignment deadline syllabus notes "
+    "lecture slides marks grading professor section chapter problem solution "
+    "thermodynamics calculus programming pointers recursion matrix integral "
+    "derivative entropy enzyme biology circuit voltage project report viva "
+    "question answer doubt help please urgent tomorrow week library hostel"
+).split()
+
+
+class Dataset:
+    """
+    Ids of what seed() created, for picking request targets.
+    """
+
+    def __init__(self, user_ids, moderator, thread_ids, post_ids, tag_ids, emails):
+        self.user_ids = user_ids
+        self.moderator = moderator
+        self.thread_ids = thread_ids
+        self.post_ids = post_ids
+        self.tag_ids = tag_ids
+        self.emails = emails
+
+    def as_dict(self):
+        return {
+            "emails": self.emails,
+            "password": SEED_PASSWORD,
+            "moderator": self.moderator.email,
+            "thread_ids": self.thread_ids,
+            "post_ids": self.post_ids,
+            "tag_ids": self.tag_ids,
+        }
+
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def paragraph(rng, user_names, mention_rate=0.1):
+    text = ". ".join(sentence(rng, rng.randint(6, 14)).capitalize() for _ in range(rng.randint(1, 4)))
+    if user_names and rng.random() < mention_rate:
+        text += f" @{rng.choice(user_names)}"
+    if rng.random() < 0.2:
+        text += "\n\n```\nint main() { return 0; }\n```"
+    return text + "."
+
+
+def ensure_login_page():
+    """
+    The login page links to Google sign-in, which fails to render without
+    a Google SocialApp; add a placeholder one if there is none.
+    """
+    if not SocialApp.objects.filter(provider="google").exists():
+        app = SocialApp.objects.create(
+            provider="google", name="Google (seeded)", client_id="seed", secret="seed"
+        )
+        app.sites.add(Site.objects.get_current())
+
+
+@transaction.atomic
+def seed(users=50, threads=500, replies=5000, likes=10000, tags=20, reports=100, seed=0, batch_size=1000):
+    """
+    Creates a reproducible dataset of the given size (replies and likes
+    are totals, spread unevenly so some threads are busy) and returns a
+    Dataset. A moderator account (superuser) is created as well; all
+    accounts use SEED_PASSWORD.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    password = make_password(SEED_PASSWORD)
+
+    User.objects.bulk_create(
+        [
+            User(username=f"seed{i}", email=f"seed{i}@example.com", password=password)
+            for i in range(users)
+        ],
+        batch_size=batch_size,
+    )
+    moderator = User.objects.create(
+        username="seed-moderator",
+        email="seed-moderator@example.com",
+        password=password,
+        is_staff=True,
+        is_superuser=True,
+    )
+    user_rows = list(User.objects.filter(username__startswith="seed").values_list("id", "username", "email"))
+    user_ids = [user_id for user_id, _, _ in user_rows]
+    user_names = [name for _, name, _ in user_rows]
+    # Verified addresses, so the accounts can log in through allauth.
+    EmailAddress.objects.bulk_create(
+        [
+            EmailAddress(user_id=user_id, email=email, verified=True, primary=True)
+            for user_id, _, email in user_rows
+        ],
+        batch_size=batch_size,
+    )
+    ensure_login_page()
+
+    category, _ = Category.objects.get_or_create(name="Benchmark", defaults={"slug": "benchmark"})
+    Tag.objects.bulk_create(
+        [Tag(name=f"seed-{i}-{rng.choice(WORDS)}", slug=f"seed-tag-{i}") for i in range(tags)],
+        batch_size=batch_size,
+    )
+    tag_ids = list(Tag.objects.filter(slug__startswith="seed-tag-").values_list("id", flat=True))
+
+    thread_objects = []
+    for _ in range(threads):
+        content = paragraph(rng, user_names)
+        thread_objects.append(Thread(
+            category=category,
+            creator_id=rng.choice(user_ids),
+            title=sentence(rng, rng.randint(4, 9)).capitalize(),
+            content=content,
+            content_html=render_markdown(content),
+            excerpt=content[:500],
+            is_locked=rng.random() < 0.05,
+        ))
+    Thread.objects.bulk_create(thread_objects, batch_size=batch_size)
+    thread_rows = list(
+        Thread.objects.filter(category=category).values_list("id", "creator_id")
+    )
+    thread_ids = [thread_id for thread_id, _ in thread_rows]
+
+    # Skewed towards the first threads, like a few hot exam threads.
+    weights = [1 / (rank + 1) for rank in range(len(thread_ids))]
+    post_objects = []
+    for thread_id in rng.choices(thread_ids, weights, k=replies):
+        content = paragraph(rng, user_names)
+        post_objects.append(Post(
+            thread_id=thread_id,
+            author_id=rng.choice(user_ids),
+            content=content,
+            content_html=render_markdown(content),
+            is_deleted=rng.random() < 0.02,
+        ))
+    Post.objects.bulk_create(post_objects, batch_size=batch_size)
+    post_ids = list(Post.objects.filter(thread_id__in=thread_ids).values_list("id", flat=True))
+
+    # Spread creation times over the last 90 days, in id order.
+    for model, ids in ((Thread, thread_ids), (Post, post_ids)):
+        step = timedelta(days=90) / max(len(ids), 1)
+        rows = [model(id=pk, created_at=now - step * (len(ids) - index)) for index, pk in enumerate(sorted(ids))]
+        model.objects.bulk_update(rows, ["created_at"], batch_size=batch_size)
+
+    thread_tags = {
+        (thread_id, tag_id)
+        for thread_id in thread_ids
+        for tag_id in rng.sample(tag_ids, min(len(tag_ids), rng.randint(0, 3)))
+    }
+    Thread.tags.through.objects.bulk_create(
+        [Thread.tags.through(thread_id=thread_id, tag_id=tag_id) for thread_id, tag_id in thread_tags],
+        batch_size=batch_size,
+    )
+
+    thread_likes = set()
+    post_likes = set()
+    for _ in range(likes):
+        if post_ids and rng.random() < 0.7:
+            post_likes.add((rng.choice(post_ids), rng.choice(user_ids)))
+        elif thread_ids:
+            thread_likes.add((rng.choice(thread_ids), rng.choice(user_ids)))
+    Thread.likes.through.objects.bulk_create(
+        [Thread.likes.through(thread_id=thread_id, user_id=user_id) for thread_id, user_id in thread_likes],
+        batch_size=batch_size,
+    )
+    Post.likes.through.objects.bulk_create(
+        [Post.likes.through(post_id=post_id, user_id=user_id) for post_id, user_id in post_likes],
+        batch_size=batch_size,
+    )
+
+    Report.objects.bulk_create(
+        [
+            Report(
+                post_id=rng.choice(post_ids),
+                reported_by_id=rng.choice(user_ids),
+                reason=sentence(rng, 6),
+                # Most reports in a live forum have been dealt with.
+                resolved=rng.random() < 0.8,
+            )
+            for _ in range(reports if post_ids else 0)
+        ],
+        batch_size=batch_size,
+    )
+
+    subscriptions = set(thread_rows)
+    subscriptions.update((post.thread_id, post.author_id) for post in post_objects)
+    ThreadSubscription.objects.bulk_create(
+        [ThreadSubscription(thread_id=thread_id, user_id=user_id) for thread_id, user_id in subscriptions],
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+
+    rebuild_counters(Thread, Post)
+    emails = [email for _, name, email in user_rows if name != moderator.username]
+    return Dataset(user_ids, moderator, thread_ids, post_ids, tag_ids, emails)
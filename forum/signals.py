@@ -1,11 +1,18 @@
 from allauth.account.signals import user_signed_up
 from django.dispatch import receiver
 from allauth.socialaccount.models import SocialAccount
-from django.db.models.signals import post_save
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.contrib.auth.models import User
-from .models import Profile, Post, Thread
-from .notifications import send_notification_email
-from .utils import extract_mentions
+from .models import Profile, Post, Report, Thread, Tag, PendingNotification
+from .notifications import flush_digest, notify_users, subscribe, subscriber_ids
+from .cache import bump_thread_version
+from .live import publish_reply
+from .search import index_thread, unindex_thread, invalidate_search_cache
+from .search.tags import tag_matcher
+from .mentions import record_mentions, username_resolver
 
 @receiver(user_signed_up)
 def populate_profile(request, user, **kwargs):
@@ -31,28 +38,10 @@ def notify_users_on_new_post(sender, instance, created, **kwargs):
         return
     thread = instance.thread
     author = instance.author
-    mentioned_users = extract_mentions(instance.content)
-    mentioned_ids = set(mentioned_users.values_list("id", flat=True))
+    mentioned_ids = record_mentions(instance)
 
-    recipients = set()
-
-    # thread creator
-    if thread.creator != author and thread.creator.email:
-        recipients.add(thread.creator.email)
-
-    # other participants
-    participants = (
-    User.objects
-    .filter(posts__thread=thread)
-    .exclude(id__in=mentioned_ids)
-    .exclude(id=author.id)
-    .distinct()
-)
-
-
-    for user in participants:
-        if user.email:
-            recipients.add(user.email)
+    # subscribers, minus those who get a mention notification below
+    recipient_ids = subscriber_ids(thread, exclude=mentioned_ids | {author.id})
     subject = f"New reply in: {thread.title}"
     message = (
         f"{author.username} replied to the thread:\n\n"
@@ -61,26 +50,67 @@ def notify_users_on_new_post(sender, instance, created, **kwargs):
         f"Visit the forum to read more."
     )
 
-    send_notification_email(subject, message, recipients)
+    notify_users(
+        recipient_ids, thread, PendingNotification.REPLY, subject, message,
+        actor=author, excerpt=instance.content,
+    )
     # mention notifications
-    mentioned_users = extract_mentions(instance.content)
-
-    for user in mentioned_users:
-        if user == author:
-            continue  # ignore self-mentions
-        if not user.email:
-            continue
-
-        send_notification_email(
-            subject=f"You were mentioned in '{thread.title}'",
-            message=(
-                f"{author.username} mentioned you in a reply.\n\n"
-                f"Thread: {thread.title}\n\n"
-                f"Excerpt:\n{instance.content[:300]}...\n\n"
-                f"Visit the forum to reply."
-            ),
-            recipients=[user.email],
-        )
+    notify_users(
+        mentioned_ids,
+        thread,
+        PendingNotification.MENTION,
+        subject=f"You were mentioned in '{thread.title}'",
+        message=(
+            f"{author.username} mentioned you in a reply.\n\n"
+            f"Thread: {thread.title}\n\n"
+            f"Excerpt:\n{instance.content[:300]}...\n\n"
+            f"Visit the forum to reply."
+        ),
+        actor=author,
+        excerpt=instance.content,
+    )
+
+    subscribe(thread, mentioned_ids | {author.id})
+
+
+@receiver(post_save, sender=Profile)
+def flush_digest_on_immediate(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Switching to immediate emails sends what the digest was holding.
+    Between hourly and daily, held notifications simply go out with the
+    new frequency's digest.
+    """
+    if created or instance.notification_frequency != Profile.IMMEDIATE:
+        return
+    if update_fields is not None and "notification_frequency" not in update_fields:
+        return
+    user_id = instance.user_id
+    transaction.on_commit(lambda: flush_digest(user_id))
+
+
+@receiver(post_save, sender=Post)
+def publish_new_reply(sender, instance, created, **kwargs):
+    if created:
+        thread_id = instance.thread_id
+        transaction.on_commit(lambda: publish_reply(thread_id))
+
+
+@receiver(post_save, sender=User)
+def invalidate_username_cache(sender, instance, created, update_fields=None, **kwargs):
+    # logins only touch last_login, which does not affect username lookups
+    if created or update_fields is None or "username" in update_fields:
+        username_resolver.invalidate()
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_username(sender, instance, **kwargs):
+    username_resolver.invalidate()
+
+
+@receiver(post_save, sender=Thread)
+def subscribe_thread_creator(sender, instance, created, **kwargs):
+    if created:
+        subscribe(instance, [instance.creator_id])
 
 
 @receiver(post_save, sender=Thread)
@@ -90,25 +120,114 @@ def notify_thread_lock_status(sender, instance, created, **kwargs):
 
     status = "locked" if instance.is_locked else "unlocked"
 
-    user_ids = set(
-    User.objects
-    .filter(posts__thread=instance)
-    .values_list("id", flat=True)
-)
-    
-    user_ids.add(instance.creator_id)
-
-    recipients = list(
-        User.objects
-        .filter(id__in=user_ids)
-        .values_list("email", flat=True)
-    )
-
     subject = f"Thread {status}: {instance.title}"
     message = (
         f"The thread '{instance.title}' has been {status} by a moderator.\n\n"
         f"If locked, replies are disabled."
     )
 
-    send_notification_email(subject, message, recipients)
+    notify_users(
+        subscriber_ids(instance), instance, PendingNotification.LOCK, subject, message,
+        excerpt=status,
+    )
+
+
+@receiver(post_save, sender=Thread)
+def update_search_index(sender, instance, update_fields=None, **kwargs):
+    # e.g. locking saves only is_locked, which the index does not hold
+    if update_fields is not None and not {"title", "content"} & set(update_fields):
+        return
+    transaction.on_commit(lambda: index_thread(instance))
+
+
+@receiver(post_delete, sender=Thread)
+def remove_from_search_index(sender, instance, **kwargs):
+    thread_id = instance.id
+    transaction.on_commit(lambda: unindex_thread(thread_id))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_matcher(sender, **kwargs):
+    transaction.on_commit(tag_matcher.invalidate)
+
+
+@receiver(post_save, sender=Thread)
+@receiver(post_delete, sender=Thread)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(m2m_changed, sender=Thread.tags.through)
+def bump_search_corpus_version(sender, **kwargs):
+    transaction.on_commit(invalidate_search_cache)
+
+
+@receiver(post_save, sender=Post)
+def count_new_reply(sender, instance, created, **kwargs):
+    if created and not instance.is_deleted:
+        Thread.objects.filter(pk=instance.thread_id).update(
+            reply_count=F("reply_count") + 1
+        )
+
+
+@receiver(post_delete, sender=Post)
+def uncount_deleted_reply(sender, instance, **kwargs):
+    if not instance.is_deleted:
+        Thread.objects.filter(pk=instance.thread_id).update(
+            reply_count=F("reply_count") - 1
+        )
+
+
+@receiver(post_save, sender=Report)
+def hide_reported_post(sender, instance, created, **kwargs):
+    """
+    Hides a post from thread pages once FORUM_REPORT_HIDE_THRESHOLD
+    different users have open reports on it.
+    """
+    threshold = settings.FORUM_REPORT_HIDE_THRESHOLD
+    if not created or not threshold:
+        return
+    reporters = (
+        Report.objects
+        .filter(post_id=instance.post_id, resolved=False)
+        .values("reported_by_id")
+        .distinct()
+        .count()
+    )
+    if reporters >= threshold:
+        instance.post.set_hidden(True)
+
+
+def invalidate_thread_pages(*thread_ids):
+    def bump():
+        for thread_id in thread_ids:
+            bump_thread_version(thread_id)
+    transaction.on_commit(bump)
+
+
+@receiver(post_save, sender=Thread)
+@receiver(post_delete, sender=Thread)
+def invalidate_thread_page(sender, instance, **kwargs):
+    invalidate_thread_pages(instance.id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_reply_thread_page(sender, instance, **kwargs):
+    invalidate_thread_pages(instance.thread_id)
+
 
+@receiver(m2m_changed, sender=Thread.tags.through)
+@receiver(m2m_changed, sender=Thread.resources.through)
+def invalidate_thread_pages_on_relation_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        invalidate_thread_pages(instance.id)
+    elif pk_set:
+        invalidate_thread_pages(*pk_set)
+
+
+@receiver(post_save, sender=Tag)
+def invalidate_tagged_thread_pages(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_thread_pages(*instance.threads.values_list("id", flat=True))
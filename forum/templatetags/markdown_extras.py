@@ -1,11 +1,9 @@
-import markdown
 from django import template
 
+from forum.rendering import cached_markdown
+
 register = template.Library()
 
 @register.filter
 def markdownify(text):
-    return markdown.markdown(
-        text,
-        extensions=["fenced_code", "tables"]
-    )
+    return cached_markdown(text)
@@ -1,3 +1,506 @@
-from django.test import TestCase
+import base64
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .likes import rebuild_counters, toggle_like
+from .management.commands import send_digests
+from .models import (
+    Category, OutboxMessage, PendingNotification, Post, Profile, RateLimitCounter, Thread,
+)
+from .notifications import claim_batch
+from .pagination import CursorPaginator, encode_cursor
+from .ratelimit import DatabaseStore, FileStore, is_limited
+from . import search
+from .search import find_threads, get_backend
+from .search.backends import IndexSearchBackend, SQLiteSearchBackend
+from .search.fts import sqlite_fts5_available
+from .search.index import InvertedIndex
+
+
+def make_thread(creator, title="A thread", content="Some content", **fields):
+    category, _ = Category.objects.get_or_create(name="General")
+    return Thread.objects.create(
+        category=category, creator=creator, title=title, content=content, **fields
+    )
+
+
+class ConnectionCountingBackend(locmem.EmailBackend):
+    """
+    locmem backend that opens and closes a connection the way the SMTP
+    backend does: send_messages() connects (and disconnects afterwards)
+    unless the connection is already open. Recipients listed in `refuse`
+    make the send fail.
+    """
+
+    connections = 0
+    refuse = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.is_open = False
+
+    def open(self):
+        if self.is_open:
+            return False
+        self.is_open = True
+        type(self).connections += 1
+        return True
+
+    def close(self):
+        self.is_open = False
+
+    def send_messages(self, messages):
+        new_connection = self.open()
+        try:
+            for message in messages:
+                if set(message.to) & set(self.refuse):
+                    raise OSError("recipient refused")
+            return super().send_messages(messages)
+        finally:
+            if new_connection:
+                self.close()
+
+
+@override_settings(EMAIL_BACKEND="forum.tests.ConnectionCountingBackend")
+class DeliverNotificationsTests(TestCase):
+    def setUp(self):
+        ConnectionCountingBackend.connections = 0
+        ConnectionCountingBackend.refuse = ()
+
+    def queue(self, *recipients):
+        OutboxMessage.objects.bulk_create(
+            OutboxMessage(recipient=recipient, subject="New reply", body="...")
+            for recipient in recipients
+        )
+
+    def deliver(self):
+        call_command("deliver_notifications", "--once", stdout=StringIO(), stderr=StringIO())
+
+    def test_sends_over_one_connection(self):
+        self.queue(*(f"user{i}@example.com" for i in range(5)))
+
+        self.deliver()
+
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(ConnectionCountingBackend.connections, 1)
+        self.assertFalse(OutboxMessage.objects.exclude(status=OutboxMessage.SENT).exists())
+
+    def test_reconnects_after_a_failed_send(self):
+        ConnectionCountingBackend.refuse = ("bad@example.com",)
+        self.queue("a@example.com", "bad@example.com", "b@example.com", "c@example.com")
+
+        self.deliver()
+
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            ["a@example.com", "b@example.com", "c@example.com"],
+        )
+        # The first connection, and one replacing it after the failure.
+        self.assertEqual(ConnectionCountingBackend.connections, 2)
+        failed = OutboxMessage.objects.get(recipient="bad@example.com")
+        self.assertEqual(failed.status, OutboxMessage.PENDING)
+        self.assertEqual(failed.attempts, 1)
+        self.assertEqual(failed.last_error, "recipient refused")
+
+    def test_claimed_messages_are_leased(self):
+        self.queue("a@example.com", "b@example.com")
+
+        self.assertEqual(len(claim_batch(10)), 2)
+        # Another worker finds nothing due while the lease runs...
+        self.assertEqual(claim_batch(10), [])
+        # ...and the messages again once it has expired.
+        OutboxMessage.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(len(claim_batch(10)), 2)
+
+
+class CursorPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice", "alice@example.com", "password")
+        for i in range(7):
+            make_thread(cls.user, title=f"Thread {i}")
+        # Ties on created_at: the id decides the order among them.
+        now = timezone.now()
+        Thread.objects.filter(id__in=list(Thread.objects.values_list("id", flat=True)[:4])).update(
+            created_at=now
+        )
+        cls.expected = list(Thread.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+
+    def paginator(self):
+        return CursorPaginator(Thread.objects.all(), 3)
+
+    def ids(self, page):
+        return [thread.id for thread in page]
+
+    def test_next_pages_cover_every_row_once(self):
+        seen = []
+        page = self.paginator().get_page()
+        self.assertFalse(page.has_previous())
+        while True:
+            seen.extend(self.ids(page))
+            if not page.has_next():
+                break
+            page = self.paginator().get_page(page.next_cursor)
+
+        self.assertEqual(seen, self.expected)
+
+    def test_previous_page_returns_the_same_rows(self):
+        first = self.paginator().get_page()
+        second = self.paginator().get_page(first.next_cursor)
+        back = self.paginator().get_page(second.previous_cursor)
+
+        self.assertEqual(self.ids(second), self.expected[3:6])
+        self.assertEqual(self.ids(back), self.ids(first))
+        self.assertFalse(back.has_previous())
+        self.assertTrue(back.has_next())
+
+    def test_invalid_cursors_give_the_first_page(self):
+        def token(values):
+            payload = json.dumps({"v": values, "d": "next"}).encode()
+            return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+        cursors = [
+            "garbage",
+            token(["x", 1]),
+            token([None, None]),
+            token([{"a": 1}, 1]),
+            token(["2026-13-45T00:00:00", 1]),
+            token([timezone.now().isoformat(), 10 ** 30]),
+            token([1]),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                page = self.paginator().get_page(cursor)
+                self.assertEqual(self.ids(page), self.expected[:3])
+
+    @override_settings(FORUM_CURSOR_PAGINATION=True)
+    def test_thread_list_ignores_tampered_cursors(self):
+        self.client.force_login(self.user)
+        cursor = encode_cursor([{"a": 1}, 1], "next")
+
+        response = self.client.get(reverse("thread_list"), {"cursor": cursor})
+
+        self.assertEqual(response.status_code, 200)
+
+
+class CounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user("alice", "alice@example.com", "password")
+        cls.bob = User.objects.create_user("bob", "bob@example.com", "password")
+        cls.thread = make_thread(cls.alice)
+
+    def reply(self, author=None):
+        return Post.objects.create(thread=self.thread, author=author or self.bob, content="A reply")
+
+    def counts(self):
+        thread = Thread.objects.get(pk=self.thread.pk)
+        return thread.like_count, thread.reply_count
+
+    def assertCountersRebuildUnchanged(self):
+        before = (
+            list(Thread.objects.order_by("id").values_list("like_count", "reply_count")),
+            list(Post.objects.order_by("id").values_list("like_count", flat=True)),
+        )
+        rebuild_counters(Thread, Post)
+        after = (
+            list(Thread.objects.order_by("id").values_list("like_count", "reply_count")),
+            list(Post.objects.order_by("id").values_list("like_count", flat=True)),
+        )
+        self.assertEqual(before, after)
+
+    def test_like_and_unlike(self):
+        post = self.reply()
+
+        self.assertTrue(toggle_like(self.thread, self.alice))
+        self.assertTrue(toggle_like(self.thread, self.bob))
+        self.assertTrue(toggle_like(post, self.alice))
+        self.assertEqual(self.counts()[0], 2)
+        self.assertEqual(Post.objects.get(pk=post.pk).like_count, 1)
+
+        self.assertFalse(toggle_like(self.thread, self.bob))
+        self.assertFalse(toggle_like(post, self.alice))
+        self.assertEqual(self.counts()[0], 1)
+        self.assertEqual(Post.objects.get(pk=post.pk).like_count, 0)
+        self.assertCountersRebuildUnchanged()
+
+    def test_replies_deletes_and_restores(self):
+        first, second, third = self.reply(), self.reply(), self.reply()
+        self.assertEqual(self.counts()[1], 3)
+
+        self.assertTrue(first.soft_delete())
+        self.assertFalse(first.soft_delete())
+        self.assertEqual(self.counts()[1], 2)
+
+        # A hard delete of a soft-deleted post was already uncounted.
+        first.delete()
+        second.delete()
+        self.assertEqual(self.counts()[1], 1)
+
+        self.assertTrue(third.soft_delete())
+        self.assertTrue(third.restore())
+        self.assertFalse(third.restore())
+        self.assertEqual(self.counts()[1], 1)
+        self.assertCountersRebuildUnchanged()
+
+    def test_saving_a_stale_post_keeps_it_deleted(self):
+        post = self.reply()
+        stale = Post.objects.get(pk=post.pk)
+        post.soft_delete()
+
+        stale.content = "Edited"
+        stale.save()
+
+        self.assertTrue(Post.objects.get(pk=post.pk).is_deleted)
+        self.assertEqual(self.counts()[1], 0)
+        self.assertCountersRebuildUnchanged()
+
+    def test_saving_a_thread_keeps_concurrent_counts(self):
+        stale = Thread.objects.get(pk=self.thread.pk)
+        toggle_like(self.thread, self.bob)
+        self.reply()
+
+        stale.title = "Renamed"
+        stale.save()
+
+        self.assertEqual(self.counts(), (1, 1))
+        self.assertCountersRebuildUnchanged()
+
+
+class RateLimitWindowMixin:
+    """
+    Sliding window over "2/m": the previous minute's hits count in
+    proportion to how much of it the sliding window still covers.
+    """
+
+    def make_store(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.store = self.make_store()
+        patcher = mock.patch("forum.ratelimit.get_store", return_value=self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def hit(self, now):
+        with mock.patch("forum.ratelimit.time") as clock:
+            clock.time.return_value = now
+            return is_limited("view:user:1", "2/m")
+
+    def test_limit_within_a_window(self):
+        self.assertEqual(self.hit(600.0), (False, 61))
+        self.assertFalse(self.hit(630.0)[0])
+        self.assertEqual(self.hit(659.5), (True, 1))
+
+    def test_previous_window_weighs_in_at_the_boundary(self):
+        for _ in range(3):
+            self.hit(600.0)
+        # Just past the boundary the previous window counts in full...
+        self.assertTrue(self.hit(660.0)[0])
+        # ...and half way through the next one, by half: 3 * 0.5 + 1.
+        self.assertTrue(self.hit(690.0)[0])
+
+    def test_windows_older_than_the_previous_one_are_ignored(self):
+        for _ in range(3):
+            self.hit(600.0)
+        self.assertFalse(self.hit(720.0)[0])
+        self.assertFalse(self.hit(780.0)[0])
+
+
+@override_settings(FORUM_RATELIMIT_PURGE_RATE=0)
+class DatabaseStoreTests(RateLimitWindowMixin, TestCase):
+    def make_store(self):
+        return DatabaseStore()
+
+    def test_purge_removes_old_windows(self):
+        self.store.hit("old", 0, 60)
+        self.store.hit("recent", 600, 60)
+
+        self.store.purge(300)
+
+        self.assertEqual(list(RateLimitCounter.objects.values_list("key", flat=True)), ["recent"])
+
+
+@override_settings(FORUM_RATELIMIT_PURGE_RATE=0)
+class FileStoreTests(RateLimitWindowMixin, TestCase):
+    def make_store(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        return FileStore(directory)
+
+    def test_purge_removes_idle_files(self):
+        self.store.hit("old", 0, 60)
+        self.store.hit("recent", 600, 60)
+        old = os.path.join(self.store.directory, hashlib.sha1(b"old").hexdigest())
+        os.utime(old, (0, 0))
+
+        self.store.purge(300)
+
+        self.assertEqual(
+            [entry.name for entry in os.scandir(self.store.directory)],
+            [hashlib.sha1(b"recent").hexdigest()],
+        )
+
+
+class SearchBackendTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice", "alice@example.com", "password")
+        cls.in_content = make_thread(
+            cls.user, title="Exam timetable", content="Bring the calculus notes along"
+        )
+        cls.in_title = make_thread(
+            cls.user, title="Calculus notes", content="Shared before the exam"
+        )
+        cls.unrelated = make_thread(cls.user, title="Lost keys", content="Near the library")
+
+    def setUp(self):
+        get_backend.cache_clear()
+        self.addCleanup(get_backend.cache_clear)
+
+    @skipUnless(
+        connection.vendor == "sqlite" and sqlite_fts5_available(connection),
+        "needs SQLite FTS5",
+    )
+    def test_sqlite_ranks_title_matches_first(self):
+        results = SQLiteSearchBackend().search("calculus")
+
+        self.assertEqual(results.count(), 2)
+        self.assertEqual(results[:2], [self.in_title.id, self.in_content.id])
+
+    def test_index_ranks_title_matches_first_and_tolerates_typos(self):
+        index = InvertedIndex()
+        index.build(Thread.objects.values_list("id", "title", "content"))
+
+        self.assertEqual(index.search("calculus"), [self.in_title.id, self.in_content.id])
+        self.assertEqual(index.search("calculsu")[:1], [self.in_title.id])
+        self.assertEqual(index.search("zebra"), [])
+
+    @skipUnless(connection.vendor == "sqlite", "SQLite picks its backend by FTS5 support")
+    @override_settings(FORUM_SEARCH_BACKEND="")
+    def test_falls_back_to_the_index_without_fts5(self):
+        with mock.patch("forum.search.fts.sqlite_fts5_available", return_value=False):
+            self.assertIsInstance(get_backend(), IndexSearchBackend)
+
+    @override_settings(FORUM_SEARCH_BACKEND="forum.search.backends.IndexSearchBackend")
+    def test_find_threads_through_the_fallback_backend(self):
+        with mock.patch("forum.search.thread_index", InvertedIndex()), \
+                mock.patch("forum.search._index_version", None):
+            results = find_threads("calculus notes")
+            self.assertEqual(list(results[:2]), [self.in_title.id, self.in_content.id])
+
+
+class StopSchedule(Exception):
+    pass
+
+
+class DigestScheduleTests(TestCase):
+    def run_schedule(self, start, sleeps):
+        """
+        Runs send_digests --schedule from `start` through `sleeps` sleeps
+        and returns the sleep lengths and the (hour, frequency) sends.
+        """
+        now = [start]
+        slept = []
+        sent = []
+
+        def sleep(seconds):
+            if len(slept) == sleeps:
+                raise StopSchedule
+            slept.append(seconds)
+            now[0] += timedelta(seconds=seconds)
+
+        def send(frequency, batch_size):
+            sent.append((now[0].hour, frequency))
+
+        command = send_digests.Command(stdout=StringIO())
+        with mock.patch.object(send_digests, "time") as clock, \
+                mock.patch.object(send_digests.timezone, "localtime", side_effect=lambda: now[0]), \
+                mock.patch.object(command, "send", side_effect=send):
+            clock.sleep.side_effect = sleep
+            with self.assertRaises(StopSchedule):
+                command.run_schedule(500)
+        return slept, sent
+
+    @override_settings(FORUM_DIGEST_DAILY_HOUR=8)
+    def test_hourly_at_every_hour_and_daily_once(self):
+        start = timezone.make_aware(datetime(2026, 1, 5, 6, 59, 30))
+
+        slept, sent = self.run_schedule(start, 3)
+
+        self.assertEqual(slept, [30, 3600, 3600])
+        self.assertEqual(sent, [
+            (7, Profile.HOURLY),
+            (8, Profile.HOURLY),
+            (8, Profile.DAILY),
+            (9, Profile.HOURLY),
+        ])
+
+    def test_switching_to_immediate_flushes_the_digest(self):
+        user = User.objects.create_user("alice", "alice@example.com", "password")
+        Profile.objects.filter(user=user).update(notification_frequency=Profile.DAILY)
+        profile = Profile.objects.get(user=user)
+        thread = make_thread(user)
+        PendingNotification.objects.create(user=user, thread=thread, kind=PendingNotification.REPLY)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.notification_frequency = Profile.IMMEDIATE
+            profile.save()
+
+        self.assertFalse(PendingNotification.objects.filter(user=user).exists())
+        digest = OutboxMessage.objects.get(recipient="alice@example.com")
+        self.assertIn("final", digest.subject)
+
+
+class SearchIndexChangeLogTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("alice", "alice@example.com", "password")
+        for patcher in (
+            mock.patch.object(search, "thread_index", InvertedIndex()),
+            mock.patch.object(search, "_index_version", None),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        search.ensure_index()
+
+    def test_changes_are_applied_without_a_rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            thread = make_thread(self.user, title="Quokka sightings")
+        with self.captureOnCommitCallbacks(execute=True):
+            make_thread(self.user, title="Lost keys")
+
+        with mock.patch.object(search, "_rebuild") as rebuild:
+            self.assertEqual(search.ensure_index().search("quokka"), [thread.id])
+            with self.captureOnCommitCallbacks(execute=True):
+                thread.delete()
+            self.assertEqual(search.ensure_index().search("quokka"), [])
+        rebuild.assert_not_called()
+
+    def test_a_gap_in_the_log_rebuilds(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            thread = make_thread(self.user, title="Quokka sightings")
+        with self.captureOnCommitCallbacks(execute=True):
+            make_thread(self.user, title="Lost keys")
+        # The first change's entry was evicted.
+        first = search._index_version + 1
+        search.cache.delete(search._change_key(first))
+
+        with mock.patch.object(search, "_rebuild", wraps=search._rebuild) as rebuild:
+            self.assertEqual(search.ensure_index().search("quokka"), [thread.id])
+        rebuild.assert_called_once()
+        self.assertEqual(search._index_version, search.get_version(search.THREAD_TEXT))
@@ -1,23 +1,37 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+
+def served(view, async_view):
+    # The async twin under an ASGI server, the sync view under WSGI.
+    return async_view if settings.FORUM_ASGI else view
+
+
 urlpatterns = [
-    path("", views.thread_list, name="thread_list"),
-    path("thread/<int:thread_id>/", views.thread_detail, name="thread_detail"),
+    path("", served(views.thread_list, views.athread_list), name="thread_list"),
+    path("thread/<int:thread_id>/", served(views.thread_detail, views.athread_detail), name="thread_detail"),
+    path("thread/<int:thread_id>/live/", served(views.thread_live_unavailable, views.thread_live), name="thread_live"),
     path("thread/create/", views.thread_create, name="thread_create"),
     path("thread/<int:thread_id>/like/", views.like_thread, name="like_thread"),
     path("thread/<int:thread_id>/lock/", views.toggle_lock_thread, name="lock_thread"),
+    path("thread/<int:thread_id>/subscription/", views.toggle_thread_subscription, name="thread_subscription"),
     path("thread/<int:thread_id>/reply/", views.post_create, name="post_create"),
 
     path("post/<int:post_id>/delete/", views.delete_post, name="delete_post"),
     path("post/<int:post_id>/report/", views.report_post, name="report_post"),
     path("post/<int:post_id>/like/", views.like_post, name="like_post"),
 
-    path("tag/<slug:slug>/", views.threads_by_tag, name="threads_by_tag"),
-    path("tags/", views.filter_by_tags, name="filter_by_tags"),
+    path("tag/<slug:slug>/", served(views.threads_by_tag, views.athreads_by_tag), name="threads_by_tag"),
+    path("tags/", served(views.filter_by_tags, views.afilter_by_tags), name="filter_by_tags"),
 
     path("moderate/", views.moderate, name="moderate"),
-    path("report/<int:report_id>/resolve/", views.resolve_report, name="resolve_report"),
+    path("post/<int:post_id>/reports/resolve/", views.resolve_reports, name="resolve_reports"),
+
+    path("search/", served(views.search_threads, views.asearch_threads), name="search_threads"),
+
+    path("mentions/", views.my_mentions, name="my_mentions"),
+    path("settings/notifications/", views.notification_settings, name="notification_settings"),
 
-    path("search/", views.search_threads, name="search_threads"),
+    path("metrics/", views.metrics, name="metrics"),
 ]
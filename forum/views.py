@@ -1,12 +1,23 @@
-from django.shortcuts import render,get_object_or_404,redirect
-from django.http import HttpResponseForbidden
-from .models import Post,Thread,Report,Tag
+from asgiref.sync import sync_to_async
+from django.shortcuts import render,get_object_or_404,redirect,aget_object_or_404
+from django.http import Http404, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from .models import Post,Thread,Report,Tag,Profile,ThreadSubscription,Mention
 from django.contrib.auth.decorators import permission_required,login_required,user_passes_test
 from django import forms
+from django.conf import settings
 from django.core.paginator import Paginator
-from django_ratelimit.decorators import ratelimit
-from rapidfuzz import fuzz
-from django.db.models import Q
+from django.utils.crypto import constant_time_compare
+from django.db.models import Count, Max, Min, Prefetch
+from .cache import THREAD_CORPUS, get_version
+from .concurrency import run_in_pool
+from .instrumentation import flush, merged_snapshot, prometheus_text
+from .likes import aliked_ids, amark_liked, liked_ids, mark_liked, toggle_like
+from .live import reply_events
+from .pages import thread_page
+from .pagination import AsyncPaginator, CursorPaginator
+from .ratelimit import rate_limit
+from .search import find_thread_ids
+from .utils import is_trusted_user
 # Create your views here.
 
 # Forms
@@ -34,108 +45,250 @@ class ReportForm(forms.ModelForm):
         model = Report
         fields = ["reason"]
 
+
+class NotificationSettingsForm(forms.ModelForm):
+    class Meta:
+        model = Profile
+        fields = ["notification_frequency"]
+        widgets = {"notification_frequency": forms.RadioSelect}
+
 # Helpers
 
-def is_trusted_user(user):
-    return user.is_superuser or user.has_perm("forum.change_thread")
+def tag_prefetch():
+    return Prefetch("tags", queryset=Tag.objects.only("id", "name", "slug"))
+
+def listed_threads():
+    """
+    Threads with just the columns listing templates render, their creator
+    and tags, so a page costs a fixed number of queries. The user's likes
+    are annotated by paginate_threads.
+    """
+    return (
+        Thread.objects
+        .select_related("creator")
+        .only(
+            "id",
+            "title",
+            "is_locked",
+            "created_at",
+            "like_count",
+            "reply_count",
+            "creator__email",
+        )
+        .prefetch_related(tag_prefetch())
+    )
+
+def thread_cursor_paginator(thread_qs, user):
+    # The total is counted on thread_qs, without the user's likes, so all
+    # users share its cached count.
+    return CursorPaginator(
+        thread_qs.with_liked_by(user),
+        13,
+        count_version=get_version(THREAD_CORPUS),
+        count_queryset=thread_qs,
+    )
+
+def paginate_threads(request, thread_qs, user):
+    """
+    Pages thread_qs with the user's likes annotated.
+    """
+    if settings.FORUM_CURSOR_PAGINATION:
+        return thread_cursor_paginator(thread_qs, user).get_page(request.GET.get("cursor"))
+    paginator = Paginator(
+        thread_qs.with_liked_by(user).order_by("-created_at", "-id"), 13
+    )
+    return paginator.get_page(request.GET.get("page"))
+
+async def apaginate_threads(request, thread_qs, user):
+    if settings.FORUM_CURSOR_PAGINATION:
+        return await thread_cursor_paginator(thread_qs, user).aget_page(request.GET.get("cursor"))
+    paginator = AsyncPaginator(
+        thread_qs.with_liked_by(user).order_by("-created_at", "-id"), 13
+    )
+    return await paginator.aget_page(request.GET.get("page"))
+
+def searched_threads():
+    return Thread.objects.only("id", "title", "is_locked", "like_count")
+
+def in_order(ids, objects_by_id):
+    return [objects_by_id[pk] for pk in ids if pk in objects_by_id]
+
+def tagged_threads(tag_ids):
+    if not tag_ids:
+        return Thread.objects.none()
+    return listed_threads().filter(
+        id__in=Thread.tags.through.objects
+        .filter(tag_id__in=tag_ids)
+        .values("thread_id")
+    )
+
+def liked_reply_ids(page):
+    # Only replies with likes can be liked by the user.
+    return [reply["id"] for reply in page["replies"] if reply["like_count"]]
+
+def thread_detail_context(page, thread_liked, liked_post_ids, subscription):
+    return {
+        "page": page,
+        "thread": page["thread"],
+        "thread_liked": thread_liked,
+        "liked_post_ids": liked_post_ids,
+        "subscribed": subscription is not None,
+        "muted": bool(subscription),
+        "latest_reply_id": max(
+            (reply["id"] for reply in page["replies"]), default=0
+        ),
+        # Each open stream holds a worker under WSGI.
+        "live_replies": settings.FORUM_ASGI,
+    }
+
+def subscription_state(thread_id, user):
+    # None when not subscribed, else whether the subscription is muted.
+    return (
+        ThreadSubscription.objects
+        .filter(thread_id=thread_id, user_id=user.id)
+        .values_list("muted", flat=True)
+    )
+
+# Listing, search, tag and thread pages come in pairs: the sync view, used
+# under WSGI, and its async twin (a-prefixed), which forum/urls.py routes
+# to under an ASGI server (FORUM_ASGI). Under WSGI an async view gains no
+# concurrency and pays for an event loop and thread hops on every request.
+
+# Rendering runs in a thread: templates resolve request.user and perms
+# lazily with sync queries.
+arender = sync_to_async(render)
 
 # Thread views
 
 @login_required
 def thread_list(request):
-    thread_qs = Thread.objects.all().order_by("-created_at")
-    paginator = Paginator(thread_qs, 13)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate_threads(request, listed_threads(), request.user)
     return render(
         request,
         "forum/thread_list.html",
         {"page_obj": page_obj}
     )
 
+@login_required
+async def athread_list(request):
+    user = await request.auser()
+    page_obj = await apaginate_threads(request, listed_threads(), user)
+    return await arender(
+        request,
+        "forum/thread_list.html",
+        {"page_obj": page_obj}
+    )
+
 @login_required
 def search_threads(request):
     query = request.GET.get("q", "").strip()
-    threads = []
-
-    if query:
-        tokens = query.lower().split()
+    thread_ids = find_thread_ids(query) if query else []
 
-        q_filter = Q()
-        for token in tokens:
-            q_filter |= Q(title__icontains=token)
-            q_filter |= Q(content__icontains=token)
-
-        candidates = Thread.objects.filter(q_filter).distinct()
-
-        content_threads = {}
-
-        for thread in candidates:
-            title_score = fuzz.token_set_ratio(query, thread.title)
-            content_score = fuzz.token_set_ratio(query, thread.content[:500])
-            score = max(title_score * 1.3, content_score)
-
-            if score >= 60:
-                content_threads[thread.id] = (score, thread)
-
-        for tag in Tag.objects.all():
-            if fuzz.token_set_ratio(query, tag.name) >= 70:
-                for thread in tag.threads.all():
-                    if thread.id not in content_threads:
-                        content_threads[thread.id] = (65, thread)
+    page_obj = Paginator(thread_ids, 13).get_page(request.GET.get("page"))
+    threads = mark_liked(
+        in_order(page_obj.object_list, searched_threads().in_bulk(page_obj.object_list)),
+        request.user,
+    )
 
-        threads = sorted(
-            content_threads.values(),
-            key=lambda item: item[0],
-            reverse=True,
-        )
+    return render(
+        request,
+        "forum/search_results.html",
+        {
+            "query": query,
+            "page_obj": page_obj,
+            "threads": threads,
+        }
+    )
 
-        threads = [thread for score, thread in threads]
+@login_required
+async def asearch_threads(request):
+    user = await request.auser()
+    query = request.GET.get("q", "").strip()
+    thread_ids = await run_in_pool(find_thread_ids, query) if query else []
 
-    paginator = Paginator(threads, 13)
-    page_obj = paginator.get_page(request.GET.get("page"))
+    page_obj = Paginator(thread_ids, 13).get_page(request.GET.get("page"))
+    threads = await amark_liked(
+        in_order(page_obj.object_list, await searched_threads().ain_bulk(page_obj.object_list)),
+        user,
+    )
 
-    return render(
+    return await arender(
         request,
         "forum/search_results.html",
         {
             "query": query,
             "page_obj": page_obj,
+            "threads": threads,
         }
     )
 
 @login_required
 def thread_detail(request, thread_id):
-    thread = get_object_or_404(Thread, id=thread_id)
-    posts = thread.posts.all().order_by("-created_at")
+    page = thread_page(thread_id)
+    user = request.user
+    liked_post_ids = liked_ids(Post, liked_reply_ids(page), user)
+    thread_liked = bool(
+        page["thread"]["like_count"] and liked_ids(Thread, [thread_id], user)
+    )
+    subscription = subscription_state(thread_id, user).first()
 
     return render(
         request,
         "forum/thread_detail.html",
-        {"thread": thread, "posts": posts},
+        thread_detail_context(page, thread_liked, liked_post_ids, subscription),
     )
 
 @login_required
-def thread_create(request):
-    if request.method == "POST" and not is_trusted_user(request.user):
-        limited = ratelimit(
-            key="user",
-            rate="3/h",
-            method="POST",
-            block=False,
-        )(lambda r: None)(request)
-
-        if limited:
-            return render(
-                request,
-                "forum/rate_limited.html",
-                {
-                    "action": "creating threads",
-                    "retry_after": "1 hour",
-                },
-                status=429,
-            )
+async def athread_detail(request, thread_id):
+    user = await request.auser()
+    page = await run_in_pool(thread_page, thread_id)
+    liked_post_ids = await aliked_ids(Post, liked_reply_ids(page), user)
+    thread_liked = bool(
+        page["thread"]["like_count"] and await aliked_ids(Thread, [thread_id], user)
+    )
+    subscription = await subscription_state(thread_id, user).afirst()
+
+    return await arender(
+        request,
+        "forum/thread_detail.html",
+        thread_detail_context(page, thread_liked, liked_post_ids, subscription),
+    )
 
+@login_required
+async def thread_live(request, thread_id):
+    """
+    Server-Sent Events stream of new replies to a thread, rendered like the
+    thread page renders them. Event ids are post ids: a reconnect resumes
+    after Last-Event-ID, a first connection after ?after= (the newest reply
+    the page showed) or from now.
+    """
+    if not await Thread.objects.filter(id=thread_id).aexists():
+        raise Http404("No Thread matches the given query.")
+
+    last_id = request.headers.get("Last-Event-ID") or request.GET.get("after")
+    try:
+        last_id = int(last_id)
+    except (TypeError, ValueError):
+        last_id = (
+            await Post.objects.filter(thread_id=thread_id).aaggregate(last=Max("id"))
+        )["last"] or 0
+
+    return StreamingHttpResponse(
+        reply_events(thread_id, last_id),
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def thread_live_unavailable(request, thread_id):
+    """
+    Stands in for thread_live under WSGI, where a stream would hold a sync
+    worker until it times out. 204 tells EventSource not to reconnect.
+    """
+    return HttpResponse(status=204)
+
+@login_required
+@rate_limit("3/h", "creating threads", skip_if=is_trusted_user)
+def thread_create(request):
     if request.method == "POST":
         form = ThreadForm(request.POST)
         if form.is_valid():
@@ -152,9 +305,9 @@ def thread_create(request):
 @login_required
 def threads_by_tag(request, slug):
     tag = get_object_or_404(Tag, slug=slug)
-    qs = Thread.objects.filter(tags=tag).order_by("-created_at")
-    paginator = Paginator(qs, 13)
-    page_obj = paginator.get_page(request.GET.get("page"))
+    page_obj = paginate_threads(
+        request, listed_threads().filter(tags=tag), request.user
+    )
 
     return render(
         request,
@@ -165,27 +318,48 @@ def threads_by_tag(request, slug):
         },
     )
 
+@login_required
+async def athreads_by_tag(request, slug):
+    user = await request.auser()
+    tag = await aget_object_or_404(Tag, slug=slug)
+    page_obj = await apaginate_threads(
+        request, listed_threads().filter(tags=tag), user
+    )
+
+    return await arender(
+        request,
+        "forum/thread_list.html",
+        {
+            "page_obj": page_obj,
+            "active_tag": tag,
+        },
+    )
+
 def filter_by_tags(request):
     tag_ids = request.GET.getlist("tags")
+    page_obj = paginate_threads(request, tagged_threads(tag_ids), request.user)
 
-    threads = Thread.objects.none()
-    selected_tags = Tag.objects.filter(id__in=tag_ids)
-
-    if tag_ids:
-        threads = Thread.objects.filter(
-            tags__id__in=tag_ids
-        ).distinct().order_by("-created_at")
+    return render(
+        request,
+        "forum/tag_filter.html",
+        {
+            "tags": Tag.objects.only("id", "name"),
+            "selected_tags": Tag.objects.filter(id__in=tag_ids),
+            "page_obj": page_obj,
+        }
+    )
 
-    paginator = Paginator(threads, 13)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+async def afilter_by_tags(request):
+    user = await request.auser()
+    tag_ids = request.GET.getlist("tags")
+    page_obj = await apaginate_threads(request, tagged_threads(tag_ids), user)
 
-    return render(
+    return await arender(
         request,
         "forum/tag_filter.html",
         {
-            "tags": Tag.objects.all(),
-            "selected_tags": selected_tags,
+            "tags": Tag.objects.only("id", "name"),
+            "selected_tags": Tag.objects.filter(id__in=tag_ids),
             "page_obj": page_obj,
         }
     )
@@ -195,10 +369,7 @@ def like_thread(request, thread_id):
     thread = get_object_or_404(Thread, id=thread_id)
     if thread.is_locked:
         return HttpResponseForbidden("Thread is locked")
-    if request.user in thread.likes.all():
-        thread.likes.remove(request.user)
-    else:
-        thread.likes.add(request.user)
+    toggle_like(thread, request.user)
     return redirect("thread_detail", thread_id=thread.id)
 
 @login_required
@@ -206,37 +377,33 @@ def like_thread(request, thread_id):
 def toggle_lock_thread(request, thread_id):
     thread = get_object_or_404(Thread, id=thread_id)
     thread.is_locked = not thread.is_locked
-    thread.save()
+    thread.save(update_fields=["is_locked"])
+    return redirect("thread_detail", thread.id)
+
+@login_required
+def toggle_thread_subscription(request, thread_id):
+    """
+    Follows a thread, or mutes/unmutes it if the user already follows it.
+    """
+    thread = get_object_or_404(Thread.objects.only("id"), id=thread_id)
+    subscription, created = ThreadSubscription.objects.get_or_create(
+        thread=thread, user=request.user
+    )
+    if not created:
+        subscription.muted = not subscription.muted
+        subscription.save(update_fields=["muted"])
     return redirect("thread_detail", thread.id)
 
 # Post views
 
 @login_required
+@rate_limit("10/m", "creating posts", skip_if=is_trusted_user)
 def post_create(request, thread_id):
     thread = get_object_or_404(Thread, id=thread_id)
 
     if thread.is_locked:
         return HttpResponseForbidden("Thread is locked")
 
-    if request.method == "POST" and not is_trusted_user(request.user):
-        limited = ratelimit(
-            key="user",
-            rate="10/m",
-            method="POST",
-            block=False,
-        )(lambda r: None)(request)
-
-        if limited:
-            return render(
-                request,
-                "forum/rate_limited.html",
-                {
-                    "action": "creating posts",
-                    "retry_after": "1 minute",
-                },
-                status=429,
-            )
-
     if request.method == "POST":
         form = PostForm(request.POST)
         if form.is_valid():
@@ -254,11 +421,10 @@ def like_post(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     if post.is_deleted:
         return HttpResponseForbidden("Post deleted")
-    if request.user in post.likes.all():
-        post.likes.remove(request.user)
-    else:
-        post.likes.add(request.user)
-    return redirect("thread_detail", post.thread.id)
+    if post.is_hidden:
+        return HttpResponseForbidden("Post hidden")
+    toggle_like(post, request.user)
+    return redirect("thread_detail", post.thread_id)
 
 @login_required
 def delete_post(request, post_id):
@@ -267,43 +433,27 @@ def delete_post(request, post_id):
     if post.thread.is_locked:
         return HttpResponseForbidden("Thread is locked")
     if request.user == post.author or request.user.has_perm("forum.delete_post"):
-        thread_id = post.thread.id
-        post.is_deleted = True
-        post.save()
-        return redirect("thread_detail", thread_id)
+        post.soft_delete()
+        # Nothing left to moderate.
+        Report.objects.filter(post=post, resolved=False).update(resolved=True)
+        return redirect("thread_detail", post.thread_id)
 
     return HttpResponseForbidden("You are not allowed to delete this post")
 
 # Reporting & moderation
 
 @login_required
+@rate_limit("5/h", "reporting posts", skip_if=is_trusted_user)
 def report_post(request, post_id):
     post = get_object_or_404(Post, id=post_id)
 
     if post.is_deleted:
         return HttpResponseForbidden("Post deleted")
+    if post.is_hidden:
+        return HttpResponseForbidden("Post hidden")
     if post.thread.is_locked:
         return HttpResponseForbidden("Thread is locked")
 
-    if request.method == "POST" and not is_trusted_user(request.user):
-        limited = ratelimit(
-            key="user",
-            rate="5/h",
-            method="POST",
-            block=False,
-        )(lambda r: None)(request)
-
-        if limited:
-            return render(
-                request,
-                "forum/rate_limited.html",
-                {
-                    "action": "reporting posts",
-                    "retry_after": "1 hour",
-                },
-                status=429,
-            )
-
     if request.method == "POST":
         form = ReportForm(request.POST)
         if form.is_valid():
@@ -320,17 +470,128 @@ def report_post(request, post_id):
 @login_required
 @permission_required("forum.delete_post", raise_exception=True)
 def moderate(request):
-    reports = Report.objects.filter(resolved=False)
-    return render(request, "forum/moderate.html", {"reports": reports})
+    """
+    Unresolved reports grouped by post, most reported first, paged by
+    cursor. A page costs three queries whatever the number of reports.
+    """
+    reported_posts = (
+        Report.objects
+        .filter(resolved=False)
+        .values("post_id")
+        .annotate(
+            report_count=Count("id"),
+            reporter_count=Count("reported_by", distinct=True),
+            first_reported=Min("created_at"),
+            last_reported=Max("created_at"),
+        )
+    )
+    page_obj = CursorPaginator(
+        reported_posts,
+        20,
+        ordering=("-reporter_count", "-report_count", "-last_reported", "-post_id"),
+    ).get_page(request.GET.get("cursor"))
+
+    post_ids = [row["post_id"] for row in page_obj]
+    posts = (
+        Post.objects
+        .select_related("thread", "author")
+        .only(
+            "id",
+            "content",
+            "is_hidden",
+            "thread__id",
+            "thread__title",
+            "author__email",
+        )
+        .in_bulk(post_ids)
+    )
+    reports = {}
+    for post_id, email, reason in (
+        Report.objects
+        .filter(resolved=False, post_id__in=post_ids)
+        .order_by("-created_at")
+        .values_list("post_id", "reported_by__email", "reason")
+    ):
+        entry = reports.setdefault(post_id, {"reporters": [], "reasons": []})
+        if email not in entry["reporters"]:
+            entry["reporters"].append(email)
+        entry["reasons"].append(reason)
+
+    for row in page_obj:
+        row["post"] = posts.get(row["post_id"])
+        row.update(reports.get(row["post_id"], {"reporters": [], "reasons": []}))
+
+    return render(request, "forum/moderate.html", {"page_obj": page_obj})
 
 
 @login_required
 @permission_required("forum.delete_post", raise_exception=True)
-def resolve_report(request, report_id):
-    report = get_object_or_404(Report, id=report_id)
-    report.resolved = True
-    report.save()
+def resolve_reports(request, post_id):
+    """
+    Dismisses every open report on a post and shows it again.
+    """
+    post = get_object_or_404(Post.objects.only("id", "thread_id", "is_hidden"), id=post_id)
+    Report.objects.filter(post=post, resolved=False).update(resolved=True)
+    post.set_hidden(False)
     return redirect("moderate")
 
+@login_required
+def notification_settings(request):
+    profile, _ = Profile.objects.get_or_create(
+        user=request.user,
+        defaults={"full_name": request.user.get_full_name()},
+    )
 
+    if request.method == "POST":
+        form = NotificationSettingsForm(request.POST, instance=profile)
+        if form.is_valid():
+            form.save()
+            return redirect("notification_settings")
+    else:
+        form = NotificationSettingsForm(instance=profile)
+
+    return render(request, "forum/notification_settings.html", {"form": form})
 
+@login_required
+def my_mentions(request):
+    """
+    Posts mentioning the current user, newest first, paged by cursor on the
+    (user, created_at, id) index of Mention. Deleted posts and posts hidden
+    after reports are left out.
+    """
+    mentions = (
+        Mention.objects
+        .filter(user=request.user, post__is_deleted=False, post__is_hidden=False)
+        .select_related("post__thread", "post__author")
+        .only(
+            "id",
+            "created_at",
+            "post__id",
+            "post__content",
+            "post__thread__id",
+            "post__thread__title",
+            "post__author__id",
+            "post__author__username",
+        )
+    )
+    page_obj = CursorPaginator(mentions, 20).get_page(request.GET.get("cursor"))
+
+    return render(request, "forum/mentions.html", {"page_obj": page_obj})
+
+# Monitoring
+
+def metrics(request):
+    """
+    Request metrics of all workers in Prometheus text format.
+    """
+    token = settings.FORUM_METRICS_TOKEN
+    authorized = (
+        token and constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}")
+    ) or request.user.is_staff
+    if not authorized:
+        return HttpResponseForbidden("Not allowed")
+    flush()
+    return HttpResponse(
+        prometheus_text(merged_snapshot()),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
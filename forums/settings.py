@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 import dj_database_url
 from dotenv import load_dotenv
 load_dotenv()
@@ -88,10 +89,14 @@ ACCOUNT_EMAIL_VALIDATORS = [
 ACCOUNT_FORMS = {
     "signup": "forum.forms.RestrictedSignupForm",
 }
+# Local load tests (manage.py forum_load) log many clients in from one IP.
+if os.environ.get("ACCOUNT_RATE_LIMITS") == "off":
+    ACCOUNT_RATE_LIMITS = False
 
 
 
 MIDDLEWARE = [
+    'forum.instrumentation.instrumentation_middleware',
     'django.middleware.security.SecurityMiddleware',
 
     'allauth.account.middleware.AccountMiddleware',
@@ -100,6 +105,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'forum.profiling.capture_middleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -108,10 +114,18 @@ ROOT_URLCONF = 'forums.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing renders for Server-Timing and metrics.
+        'BACKEND': 'forum.instrumentation.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / "templates"],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Templates are compiled once per process (and precompiled
+            # before fork by gunicorn.conf.py).
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
@@ -133,7 +147,34 @@ DATABASES = {
     )
 }
 
-EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+# Cache
+# Defaults to a per-process LocMemCache, on which gunicorn.conf.py runs a
+# single worker. Multi-worker deployments need a shared backend so cache
+# versions agree across workers: redis (or memcached), whose incr and add
+# are atomic. FileBasedCache is shared between the workers of one host,
+# but concurrent version bumps on it can be lost (forum.W002).
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", ""),
+    }
+}
+# These backends evict entries at random once they hold MAX_ENTRIES (300
+# by default), version keys included; size them for thread pages.
+if CACHES["default"]["BACKEND"] in (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.filebased.FileBasedCache",
+):
+    CACHES["default"]["OPTIONS"] = {
+        "MAX_ENTRIES": int(os.environ.get("CACHE_MAX_ENTRIES", 20000)),
+    }
+
+EMAIL_BACKEND = os.environ.get(
+    "EMAIL_BACKEND", "django.core.mail.backends.smtp.EmailBackend"
+)
 EMAIL_HOST = "smtp.gmail.com"
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -141,6 +182,95 @@ EMAIL_HOST_USER = os.environ.get("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD")
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+# Forum
+
+# Dotted path to a search backend class; empty picks the database's native
+# full-text search (PostgreSQL or SQLite FTS5), falling back to the
+# in-process index (forum.search.backends.IndexSearchBackend).
+FORUM_SEARCH_BACKEND = os.environ.get("FORUM_SEARCH_BACKEND", "")
+FORUM_SEARCH_MAX_RESULTS = int(os.environ.get("FORUM_SEARCH_MAX_RESULTS", 500))
+FORUM_SEARCH_CACHE_TIMEOUT = int(os.environ.get("FORUM_SEARCH_CACHE_TIMEOUT", 300))
+# Changed thread ids kept for the in-process index to catch up from; a
+# process further behind (or finding an entry gone) rebuilds its index.
+FORUM_SEARCH_CHANGE_LOG_SIZE = int(os.environ.get("FORUM_SEARCH_CHANGE_LOG_SIZE", 1000))
+FORUM_SEARCH_CHANGE_LOG_TIMEOUT = int(os.environ.get("FORUM_SEARCH_CHANGE_LOG_TIMEOUT", 86400))
+
+# Keyset (cursor) pagination for thread listings instead of page numbers.
+FORUM_CURSOR_PAGINATION = os.environ.get("FORUM_CURSOR_PAGINATION", "False") == "True"
+FORUM_PAGINATION_COUNT_TIMEOUT = int(os.environ.get("FORUM_PAGINATION_COUNT_TIMEOUT", 300))
+
+# True when served by an ASGI server (the uvicorn profile): listing, search,
+# tag and thread pages use their async views, and thread pages stream new
+# replies. Under WSGI the sync views serve them.
+FORUM_ASGI = os.environ.get("FORUM_ASGI", "False") == "True"
+
+# Threads available to async views for CPU-heavy work (search scoring,
+# building thread pages).
+FORUM_CPU_POOL_SIZE = int(os.environ.get("FORUM_CPU_POOL_SIZE", min(4, os.cpu_count() or 1)))
+
+# Live replies (only under FORUM_ASGI): fan-out between processes (empty
+# picks Postgres LISTEN/NOTIFY on Postgres, forum.live.LocalFanout
+# otherwise). A stream is closed after FORUM_LIVE_MAX_AGE seconds and the
+# browser reconnects where it left off.
+FORUM_LIVE_BACKEND = os.environ.get("FORUM_LIVE_BACKEND", "")
+FORUM_LIVE_KEEPALIVE = int(os.environ.get("FORUM_LIVE_KEEPALIVE", 15))
+FORUM_LIVE_MAX_AGE = int(os.environ.get("FORUM_LIVE_MAX_AGE", 300))
+FORUM_LIVE_RETRY_MS = int(os.environ.get("FORUM_LIVE_RETRY_MS", 3000))
+
+# Request metrics: each worker writes a snapshot to FORUM_METRICS_DIR at
+# most every FORUM_METRICS_FLUSH_INTERVAL seconds; /metrics merges them.
+# Scrapers authenticate with "Authorization: Bearer <FORUM_METRICS_TOKEN>";
+# staff users can view it when logged in.
+FORUM_METRICS_DIR = os.environ.get(
+    "FORUM_METRICS_DIR", os.path.join(tempfile.gettempdir(), "forum-metrics")
+)
+FORUM_METRICS_FLUSH_INTERVAL = int(os.environ.get("FORUM_METRICS_FLUSH_INTERVAL", 5))
+FORUM_METRICS_TOKEN = os.environ.get("FORUM_METRICS_TOKEN", "")
+
+# Requests slower than FORUM_SLOW_REQUEST_MS (0 disables) are captured with
+# their SQL and stack samples taken every FORUM_SLOW_SAMPLE_INTERVAL ms
+# while running late; trusted users profile one request with ?_profile=1.
+# The newest FORUM_CAPTURE_LIMIT captures are kept (admin: Request captures).
+FORUM_SLOW_REQUEST_MS = int(os.environ.get("FORUM_SLOW_REQUEST_MS", 1000))
+FORUM_SLOW_SAMPLE_INTERVAL = int(os.environ.get("FORUM_SLOW_SAMPLE_INTERVAL", 50))
+FORUM_PROFILE_SAMPLE_INTERVAL = int(os.environ.get("FORUM_PROFILE_SAMPLE_INTERVAL", 5))
+FORUM_CAPTURE_LIMIT = int(os.environ.get("FORUM_CAPTURE_LIMIT", 500))
+
+# Rate limits are counted in a store shared by all workers:
+# forum.ratelimit.DatabaseStore (any number of hosts) or
+# forum.ratelimit.FileStore (one host, counters under FORUM_RATELIMIT_DIR).
+FORUM_RATELIMIT_STORE = os.environ.get("FORUM_RATELIMIT_STORE", "forum.ratelimit.DatabaseStore")
+FORUM_RATELIMIT_DIR = os.environ.get(
+    "FORUM_RATELIMIT_DIR", os.path.join(tempfile.gettempdir(), "forum-ratelimit")
+)
+# Fraction of limited requests that also purge counters older than
+# FORUM_RATELIMIT_RETENTION seconds (at least twice the longest period).
+FORUM_RATELIMIT_PURGE_RATE = float(os.environ.get("FORUM_RATELIMIT_PURGE_RATE", 0.01))
+FORUM_RATELIMIT_RETENTION = int(os.environ.get("FORUM_RATELIMIT_RETENTION", 2 * 86400))
+
+# Notification outbox: failed sends are retried with exponential backoff
+# starting at FORUM_OUTBOX_RETRY_DELAY seconds. A worker leases the
+# messages it sends for FORUM_OUTBOX_LEASE seconds (longer than a batch
+# takes to send); if it dies, they are sent again after that.
+FORUM_OUTBOX_MAX_ATTEMPTS = int(os.environ.get("FORUM_OUTBOX_MAX_ATTEMPTS", 5))
+FORUM_OUTBOX_RETRY_DELAY = int(os.environ.get("FORUM_OUTBOX_RETRY_DELAY", 60))
+FORUM_OUTBOX_MAX_RETRY_DELAY = int(os.environ.get("FORUM_OUTBOX_MAX_RETRY_DELAY", 3600))
+FORUM_OUTBOX_LEASE = int(os.environ.get("FORUM_OUTBOX_LEASE", 600))
+
+# Hour of the day (in TIME_ZONE) at which `send_digests --schedule` sends
+# daily digests; hourly ones go out at the top of every hour.
+FORUM_DIGEST_DAILY_HOUR = int(os.environ.get("FORUM_DIGEST_DAILY_HOUR", 8))
+
+# Seconds a rendered thread page stays cached (it is also invalidated on change).
+FORUM_THREAD_CACHE_TIMEOUT = int(os.environ.get("FORUM_THREAD_CACHE_TIMEOUT", 600))
+
+# Entries in the per-process cache of markdown rendered by the template filter.
+FORUM_MARKDOWN_CACHE_SIZE = int(os.environ.get("FORUM_MARKDOWN_CACHE_SIZE", 2048))
+
+# A post is hidden from thread pages once this many different users have
+# open reports on it (0 disables), until a moderator dismisses them.
+FORUM_REPORT_HIDE_THRESHOLD = int(os.environ.get("FORUM_REPORT_HIDE_THRESHOLD", 5))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -0,0 +1,56 @@
+# Production boot profile: the app is imported and warmed once in the
+# master, then forked, so workers share its memory copy-on-write and
+# serve their first requests without importing or compiling anything.
+import gc
+import multiprocessing
+import os
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "forums.settings")
+
+from forum.cache import cache_is_shared  # noqa: E402
+
+wsgi_app = "forums.wsgi:application"
+# Platforms like Heroku pass the port to listen on in $PORT.
+bind = os.environ.get("GUNICORN_BIND", f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+# Cached pages, search results, tags and usernames are invalidated through
+# cache versions, which workers only agree on through a shared cache
+# (CACHE_BACKEND); with the default per-process cache there is one worker.
+if cache_is_shared():
+    workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+else:
+    workers = 1
+preload_app = True
+
+
+def on_starting(server):
+    from forum.instrumentation import clear_snapshots
+
+    if not cache_is_shared():
+        if server.cfg.workers > 1:
+            raise RuntimeError(
+                f"{server.cfg.workers} workers need a cache shared between them; "
+                "set CACHE_BACKEND (and CACHE_LOCATION) or run one worker"
+            )
+        if int(os.environ.get("WEB_CONCURRENCY", 1)) > 1:
+            server.log.warning(
+                "Ignoring WEB_CONCURRENCY: running one worker, the cache is per-process"
+            )
+
+    clear_snapshots()
+
+
+def when_ready(server):
+    from forum.boot import warm_up
+
+    for name, seconds in warm_up():
+        server.log.info("Warm-up %s: %.1f ms", name, seconds * 1000)
+
+    # Keep the warmed objects out of the collector's generations, so GC
+    # passes in the workers do not touch (and copy) the shared pages.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from django.db import connections
+
+    connections.close_all()